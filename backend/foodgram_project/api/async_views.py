@@ -0,0 +1,361 @@
+"""
+Асинхронные версии частых запросов на чтение для запуска через ASGI.
+Независимые подзапросы одного ответа (страница рецептов, их число и
+ETag, подписки зрителя) выполняются параллельно в отдельных потоках,
+каждый со своим соединением с БД. Запросы на запись и режимы, которых
+здесь нет, передаются обычным представлениям DRF.
+"""
+import asyncio
+import math
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.core.paginator import Page, Paginator
+from django.db import close_old_connections
+from django.http import HttpResponseNotModified, JsonResponse
+from django.utils.http import parse_etags
+from rest_framework.exceptions import (
+    AuthenticationFailed,
+    NotAuthenticated,
+    NotFound,
+)
+
+from .authentication import CachedTokenAuthentication
+from .catalog import filter_by_name, get_catalog
+from .conditional import (
+    feed_validator,
+    is_conditional,
+    not_modified,
+    recipe_validators,
+    set_validators,
+)
+from .feed_cache import cache_response, feed_cache_key
+from .filters import RecipeFilter
+from .paginator import FollowResultsSetPagination, RecipeResultsSetPagination
+from .serializers import (
+    FollowSerializer,
+    IngredientSerializer,
+    RecipeReadSerializer,
+    TagSerializer,
+    get_followed_ids,
+)
+from .views import (
+    FollowViewSet,
+    IngredientViewSet,
+    RecipeViewSet,
+    TagViewSet,
+    get_recipes_limit,
+)
+from recipes.models import Follow, Ingredient, Recipe, Tag
+
+INVALID_PAGE_MESSAGE = 'Неправильная страница'
+NOT_AUTHENTICATED_MESSAGE = NotAuthenticated.default_detail
+NOT_FOUND_MESSAGE = NotFound.default_detail
+
+recipe_list_view = RecipeViewSet.as_view({'get': 'list', 'post': 'create'})
+recipe_detail_view = RecipeViewSet.as_view({
+    'get': 'retrieve',
+    'put': 'update',
+    'patch': 'partial_update',
+    'delete': 'destroy',
+})
+subscriptions_view = FollowViewSet.as_view({'get': 'list'})
+tag_list_view = TagViewSet.as_view({'get': 'list'})
+tag_detail_view = TagViewSet.as_view({'get': 'retrieve'})
+ingredient_list_view = IngredientViewSet.as_view({'get': 'list'})
+ingredient_detail_view = IngredientViewSet.as_view({'get': 'retrieve'})
+
+
+def in_thread(func, *args, **kwargs):
+    """
+    Выполняет синхронный код в потоке из общего пула, а не в потоке
+    запроса, поэтому несколько вызовов идут параллельно.
+    """
+    def run():
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False)()
+
+
+def json_response(data, status=200):
+    return JsonResponse(
+        data,
+        status=status,
+        safe=False,
+        json_dumps_params={
+            'ensure_ascii': False, 'separators': (',', ':')
+        },
+    )
+
+
+def async_read_view(fallback):
+    """
+    Асинхронное представление для GET; остальные методы, а также запросы,
+    для которых view вернуло None, обрабатывает fallback. Пагинаторы DRF
+    читают параметры из query_params, поэтому он добавляется к запросу.
+    """
+    def decorator(view):
+        async def wrapper(request, *args, **kwargs):
+            response = None
+            request.query_params = request.GET
+            if request.method == 'GET':
+                response = await authenticate(request)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+            if response is None:
+                response = await sync_to_async(fallback)(
+                    request, *args, **kwargs
+                )
+            return response
+
+        wrapper.csrf_exempt = True
+        return wrapper
+
+    return decorator
+
+
+async def authenticate(request):
+    """
+    Проверка токена через CachedTokenAuthentication. Возвращает ответ
+    401 для неверного токена, иначе None.
+    """
+    request.user = AnonymousUser()
+    if 'Authorization' not in request.headers:
+        return None
+    try:
+        credentials = await in_thread(
+            CachedTokenAuthentication().authenticate, request
+        )
+    except AuthenticationFailed as error:
+        response = json_response({'detail': error.detail}, 401)
+        response['WWW-Authenticate'] = 'Token'
+        return response
+    if credentials is not None:
+        request.user, _ = credentials
+    return None
+
+
+async def viewer_followed_ids(request):
+    if request.user.is_authenticated:
+        await in_thread(get_followed_ids, request)
+
+
+async def cached_response(request, key):
+    cached = await caches[settings.FEED_CACHE].aget(key)
+    if cached is None:
+        return None
+    data, etag, last_modified = cached
+    return not_modified(request, etag, last_modified) or set_validators(
+        json_response(data), etag, last_modified
+    )
+
+
+def page_number(request):
+    number = request.GET.get('page', '1')
+    return int(number) if number.isdigit() and int(number) > 0 else None
+
+
+def paginated_data(pagination, request, rows, number, count, data):
+    """Ответ в формате PageNumberPagination с известным числом объектов."""
+    paginator = Paginator([], pagination.get_page_size(request))
+    paginator.count = count
+    pagination.request = request
+    pagination.page = Page(rows, number, paginator)
+    return {
+        'count': count,
+        'next': pagination.get_next_link(),
+        'previous': pagination.get_previous_link(),
+        'results': data,
+    }
+
+
+def serialize(serializer_class, instance, **context):
+    return serializer_class(
+        instance, many=isinstance(instance, list), context=context
+    ).data
+
+
+def filter_recipes(request):
+    recipes = RecipeFilter(
+        request.GET,
+        queryset=Recipe.objects.with_user_flags(
+            request.user
+        ).with_related(),
+        request=request,
+    )
+    if not recipes.is_valid():
+        return None, {
+            field: list(messages)
+            for field, messages in recipes.errors.items()
+        }
+    return recipes.qs, None
+
+
+@async_read_view(recipe_list_view)
+async def recipe_list(request):
+    pagination = RecipeResultsSetPagination()
+    if pagination.is_keyset(request):
+        return None
+    cache_key = await sync_to_async(feed_cache_key)(request)
+    if cache_key and (response := await cached_response(request, cache_key)):
+        return response
+    number = page_number(request)
+    if number is None:
+        return json_response({'detail': INVALID_PAGE_MESSAGE}, 404)
+    queryset, errors = await in_thread(filter_recipes, request)
+    if errors is not None:
+        return json_response(errors, 400)
+    page_size = pagination.get_page_size(request)
+    offset = (number - 1) * page_size
+    rows = in_thread(lambda: list(queryset[offset:offset + page_size]))
+    feed = in_thread(feed_validator, request, queryset)
+    if is_conditional(request):
+        etag, count = await feed
+        response = not_modified(request, etag)
+        if response is not None:
+            rows.close()
+            return response
+        rows, _ = await asyncio.gather(rows, viewer_followed_ids(request))
+    else:
+        rows, (etag, count), _ = await asyncio.gather(
+            rows, feed, viewer_followed_ids(request)
+        )
+    if number > max(1, math.ceil(count / page_size)):
+        return json_response({'detail': INVALID_PAGE_MESSAGE}, 404)
+    data = paginated_data(
+        pagination, request, rows, number, count,
+        await in_thread(
+            serialize, RecipeReadSerializer, rows,
+            request=request, image_variant='card',
+        ),
+    )
+    if cache_key:
+        await sync_to_async(cache_response)(cache_key, data, etag)
+    return set_validators(json_response(data), etag)
+
+
+@async_read_view(recipe_detail_view)
+async def recipe_detail(request, pk):
+    cache_key = await sync_to_async(feed_cache_key)(request, pk)
+    if cache_key and (response := await cached_response(request, cache_key)):
+        return response
+    if is_conditional(request):
+        updated_at = await Recipe.objects.filter(pk=pk).values_list(
+            'updated_at', flat=True
+        ).afirst()
+        if updated_at is not None:
+            response = not_modified(
+                request, *recipe_validators(request, pk, updated_at)
+            )
+            if response is not None:
+                return response
+    recipe, _ = await asyncio.gather(
+        in_thread(
+            lambda: Recipe.objects.with_user_flags(
+                request.user
+            ).with_related().filter(pk=pk).first()
+        ),
+        viewer_followed_ids(request),
+    )
+    if recipe is None:
+        return json_response({'detail': NOT_FOUND_MESSAGE}, 404)
+    data = await in_thread(
+        serialize, RecipeReadSerializer, recipe,
+        request=request, image_variant='full',
+    )
+    etag, last_modified = recipe_validators(
+        request, recipe.pk, recipe.updated_at
+    )
+    if cache_key:
+        await sync_to_async(cache_response)(
+            cache_key, data, etag, last_modified
+        )
+    return set_validators(json_response(data), etag, last_modified)
+
+
+async def catalog_response(request, name, build, pk=None):
+    catalog = await in_thread(get_catalog, name, build)
+    if pk is None:
+        data = catalog.items
+        if name == 'ingredients':
+            data = filter_by_name(data, request.GET.get('name'))
+    else:
+        data = catalog.by_id.get(pk)
+        if data is None:
+            return json_response({'detail': NOT_FOUND_MESSAGE}, 404)
+    if catalog.etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = json_response(data)
+    response['ETag'] = catalog.etag
+    return response
+
+
+def build_tags():
+    return serialize(TagSerializer, list(Tag.objects.all()))
+
+
+def build_ingredients():
+    return serialize(IngredientSerializer, list(Ingredient.objects.all()))
+
+
+@async_read_view(tag_list_view)
+async def tag_list(request):
+    return await catalog_response(request, TagViewSet.catalog_name, build_tags)
+
+
+@async_read_view(tag_detail_view)
+async def tag_detail(request, pk):
+    return await catalog_response(
+        request, TagViewSet.catalog_name, build_tags, pk
+    )
+
+
+@async_read_view(ingredient_list_view)
+async def ingredient_list(request):
+    return await catalog_response(
+        request, IngredientViewSet.catalog_name, build_ingredients
+    )
+
+
+@async_read_view(ingredient_detail_view)
+async def ingredient_detail(request, pk):
+    return await catalog_response(
+        request, IngredientViewSet.catalog_name, build_ingredients, pk
+    )
+
+
+@async_read_view(subscriptions_view)
+async def subscriptions(request):
+    pagination = FollowResultsSetPagination()
+    if pagination.is_keyset(request):
+        return None
+    if not request.user.is_authenticated:
+        return json_response({'detail': NOT_AUTHENTICATED_MESSAGE}, 401)
+    number = page_number(request)
+    if number is None:
+        return json_response({'detail': INVALID_PAGE_MESSAGE}, 404)
+    follows = Follow.objects.filter(user=request.user)
+    page_size = pagination.get_page_size(request)
+    offset = (number - 1) * page_size
+    rows, count, _ = await asyncio.gather(
+        in_thread(lambda: list(follows.with_recipes(
+            get_recipes_limit(request)
+        ).order_by(
+            *FollowResultsSetPagination.keyset_ordering
+        )[offset:offset + page_size])),
+        follows.acount(),
+        viewer_followed_ids(request),
+    )
+    if number > max(1, math.ceil(count / page_size)):
+        return json_response({'detail': INVALID_PAGE_MESSAGE}, 404)
+    return json_response(paginated_data(
+        pagination, request, rows, number, count,
+        await in_thread(serialize, FollowSerializer, rows, request=request),
+    ))
@@ -0,0 +1,147 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+
+from .versions import bump_version, get_version
+
+
+TOKEN_OWNER_TIMEOUT = 60 * 60 * 24
+
+
+def token_owner_key(key):
+    return 'auth-token-{}'.format(hashlib.sha256(key.encode()).hexdigest())
+
+
+def remember_token_owner(key, user_id):
+    caches[settings.AUTH_CACHE].set(
+        token_owner_key(key), user_id, TOKEN_OWNER_TIMEOUT
+    )
+
+
+def get_token_owner(model, key):
+    """
+    Владелец токена из общего кэша: у токена он не меняется, поэтому
+    база читается только для токенов, созданных до включения кэша.
+    """
+    user_id = caches[settings.AUTH_CACHE].get(token_owner_key(key))
+    if user_id is None:
+        user_id = model.objects.filter(key=key).values_list(
+            'user_id', flat=True
+        ).first()
+        if user_id is not None:
+            remember_token_owner(key, user_id)
+    return user_id
+
+
+def user_version_key(user_id):
+    return f'auth-version-{user_id}'
+
+
+def get_user_version(user_id):
+    """
+    Версия хранится в кэше AUTH_CACHE. Если её вытеснят, назначится
+    новая, и снимки пользователя просто перечитаются из базы.
+    """
+    return get_version(user_version_key(user_id), settings.AUTH_CACHE)
+
+
+def bump_user_version(user_id):
+    """Сбрасывает снимки пользователя в кэшах токенов всех процессов."""
+    bump_version(user_version_key(user_id), settings.AUTH_CACHE)
+
+
+class TokenCache:
+    """
+    Кэш токен -> (пользователь, токен, версия) в памяти процесса: не
+    больше size записей, каждая живёт не дольше ttl секунд.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.metrics = dict.fromkeys(
+            ('hits', 'misses', 'stale', 'evictions'), 0
+        )
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.entries.pop(key, None)
+                self.metrics['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            return entry[1:]
+
+    def set(self, key, user, token, version):
+        with self.lock:
+            self.entries[key] = (
+                time.monotonic() + self.ttl, user, token, version
+            )
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.metrics['evictions'] += 1
+
+    def record(self, hit):
+        with self.lock:
+            self.metrics['hits' if hit else 'stale'] += 1
+
+    def stats(self):
+        with self.lock:
+            requests = sum(
+                self.metrics[name] for name in ('hits', 'misses', 'stale')
+            )
+            return {
+                **self.metrics,
+                'size': len(self.entries),
+                'max_size': self.size,
+                'hit_rate': (
+                    self.metrics['hits'] / requests if requests else None
+                ),
+            }
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication, который запоминает пользователя токена. Снимок
+    действителен, пока не изменилась версия пользователя в общем кэше:
+    её меняют удаление токена, а также сохранение и удаление
+    пользователя, в том числе смена пароля и деактивация.
+    """
+
+    def authenticate_credentials(self, key):
+        entry = token_cache.get(key)
+        if entry is not None:
+            user, token, version = entry
+            if get_user_version(user.id) == version:
+                token_cache.record(hit=True)
+                user, token = copy.copy(user), copy.copy(token)
+                token.user = user
+                return user, token
+            token_cache.record(hit=False)
+        # Версия читается до пользователя: изменение между запросами
+        # оставит в кэше старую версию, а не свежую с устаревшим снимком.
+        user_id = get_token_owner(self.get_model(), key)
+        version = None if user_id is None else get_user_version(user_id)
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(
+            key,
+            copy.copy(user),
+            self.get_model()(
+                key=token.key, user_id=token.user_id, created=token.created
+            ),
+            version,
+        )
+        return user, token
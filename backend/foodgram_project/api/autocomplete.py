@@ -0,0 +1,121 @@
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db.models import Case, IntegerField, Value, When
+
+from .catalog import get_catalog_version
+from recipes.models import Ingredient
+
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+
+class IngredientIndex:
+    """
+    Индекс каталога продуктов в памяти процесса для автодополнения.
+
+    Совпадения ранжируются так: сначала названия, начинающиеся с запроса,
+    затем названия, в которых с запроса начинается одно из слов, затем
+    названия, содержащие запрос в любом месте.
+    """
+
+    def __init__(self, rows):
+        self.entries = [
+            {'id': id, 'name': name, 'measurement_unit': measurement_unit}
+            for id, name, measurement_unit in rows
+        ]
+        self.entries.sort(key=lambda entry: entry['name'].lower())
+        self.names = [entry['name'].lower() for entry in self.entries]
+        words = sorted(
+            (word, position)
+            for position, name in enumerate(self.names)
+            for word in name.split()[1:]
+        )
+        self.words = [word for word, _ in words]
+        self.word_positions = [position for _, position in words]
+
+    @classmethod
+    def build(cls):
+        return cls(Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit'
+        ))
+
+    def search(self, query, limit):
+        query = query.strip().lower()
+        if not query:
+            return []
+        found = []
+        seen = set()
+
+        def collect(positions):
+            for position in positions:
+                if len(found) >= limit:
+                    return
+                if position not in seen:
+                    seen.add(position)
+                    found.append(self.entries[position])
+
+        collect(self.prefix_range(self.names, query))
+        collect(
+            self.word_positions[index]
+            for index in self.prefix_range(self.words, query)
+        )
+        collect(
+            position for position, name in enumerate(self.names)
+            if query in name
+        )
+        return found
+
+    @staticmethod
+    def prefix_range(values, prefix):
+        index = bisect_left(values, prefix)
+        while index < len(values) and values[index].startswith(prefix):
+            yield index
+            index += 1
+
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Индекс перестраивается, когда меняется версия справочников."""
+    global _index, _index_version
+    version = get_catalog_version()
+    with _index_lock:
+        if _index is None or _index_version != version:
+            _index = IngredientIndex.build()
+            _index_version = version
+        return _index
+
+
+def trigram_search(query, limit):
+    """
+    Ранжированный поиск средствами PostgreSQL; использует триграммный
+    GIN-индекс по UPPER(name).
+    """
+    query = query.strip()
+    if not query:
+        return []
+    return list(
+        Ingredient.objects.filter(name__icontains=query).annotate(
+            rank=Case(
+                When(name__istartswith=query, then=Value(0)),
+                When(name__icontains=' ' + query, then=Value(1)),
+                default=Value(2),
+                output_field=IntegerField(),
+            ),
+            similarity=TrigramSimilarity('name', query),
+        ).order_by('rank', '-similarity', 'name').values(
+            'id', 'name', 'measurement_unit'
+        )[:limit]
+    )
+
+
+def search_ingredients(query, limit=AUTOCOMPLETE_LIMIT):
+    if settings.INGREDIENT_SEARCH_BACKEND == 'trigram':
+        return trigram_search(query, limit)
+    return get_index().search(query, limit)
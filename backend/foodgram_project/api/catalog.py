@@ -0,0 +1,101 @@
+import hashlib
+import json
+import threading
+
+from django.http import Http404
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .versions import bump_version, get_version
+
+CATALOG_VERSION_KEY = 'catalog-version'
+
+
+def get_catalog_version():
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    bump_version(CATALOG_VERSION_KEY)
+
+
+class Catalog:
+    """Сериализованный справочник, построенный для одной версии."""
+
+    def __init__(self, version, items):
+        self.version = version
+        self.items = items
+        self.by_id = {item['id']: item for item in items}
+        self.etag = '"{}"'.format(hashlib.md5(
+            json.dumps(items, ensure_ascii=False).encode()
+        ).hexdigest())
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(name, build):
+    """
+    Возвращает справочник из памяти процесса; build() вызывается,
+    только если версия в общем кэше изменилась.
+    """
+    version = get_catalog_version()
+    with _catalogs_lock:
+        catalog = _catalogs.get(name)
+        if catalog is None or catalog.version != version:
+            catalog = _catalogs[name] = Catalog(version, build())
+        return catalog
+
+
+def filter_by_name(items, name):
+    """Элементы справочника, название которых начинается с name."""
+    name = (name or '').lower()
+    if not name:
+        return items
+    return [item for item in items if item['name'].lower().startswith(name)]
+
+
+class CatalogViewSetMixin:
+    """
+    Отдаёт list и retrieve из кэша справочника с поддержкой
+    If-None-Match. Фильтрация списка выполняется в filter_catalog.
+    """
+
+    catalog_name = None
+
+    def get_catalog(self):
+        return get_catalog(
+            self.catalog_name,
+            lambda: self.get_serializer(
+                self.get_queryset(), many=True
+            ).data,
+        )
+
+    def filter_catalog(self, items):
+        return items
+
+    def catalog_response(self, catalog, data):
+        if catalog.etag in parse_etags(
+            self.request.headers.get('If-None-Match', '')
+        ):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+        response['ETag'] = catalog.etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        catalog = self.get_catalog()
+        return self.catalog_response(
+            catalog, self.filter_catalog(catalog.items)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        catalog = self.get_catalog()
+        pk = kwargs[self.lookup_field]
+        item = catalog.by_id.get(int(pk)) if pk.isdigit() else None
+        if item is None:
+            raise Http404
+        return self.catalog_response(catalog, item)
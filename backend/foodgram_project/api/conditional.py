@@ -0,0 +1,115 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    return '"{}"'.format(hashlib.md5(
+        ':'.join(str(part) for part in parts).encode()
+    ).hexdigest())
+
+
+def is_conditional(request):
+    return (
+        'If-None-Match' in request.headers
+        or 'If-Modified-Since' in request.headers
+    )
+
+
+def follows_changed_key(user_id):
+    return f'follows-changed-{user_id}'
+
+
+def follows_changed(user_id):
+    """
+    Отмечает, что пользователь изменил подписки. От них зависит только
+    флаг is_subscribed в его ответах, поэтому рецепты авторов не
+    обновляются, а момент изменения входит в валидаторы зрителя.
+    """
+    transaction.on_commit(lambda: caches[settings.AUTH_CACHE].set(
+        follows_changed_key(user_id), timezone.now(), None
+    ))
+
+
+def follows_changed_at(request):
+    """
+    Момент последнего изменения подписок зрителя или None для анонима.
+    Вытесненное из кэша значение заменяется текущим моментом: валидаторы
+    лишь перестанут совпадать, но не устареют.
+    """
+    if not request.user.is_authenticated:
+        return None
+    if not hasattr(request, 'follows_changed_at'):
+        cache = caches[settings.AUTH_CACHE]
+        key = follows_changed_key(request.user.pk)
+        changed_at = cache.get(key)
+        if changed_at is None:
+            cache.add(key, timezone.now(), None)
+            changed_at = cache.get(key)
+        request.follows_changed_at = changed_at
+    return request.follows_changed_at
+
+
+def viewer_version(request):
+    changed_at = follows_changed_at(request)
+    return request.user.pk, changed_at and changed_at.isoformat()
+
+
+def recipe_validators(request, recipe_id, updated_at):
+    """
+    ETag и Last-Modified рецепта. Флаги избранного, корзины и подписки
+    зависят от зрителя, поэтому в валидаторы входят пользователь и
+    момент изменения его подписок.
+    """
+    changed_at = follows_changed_at(request)
+    return make_etag(
+        *viewer_version(request), recipe_id, updated_at.isoformat()
+    ), max(updated_at, changed_at) if changed_at else updated_at
+
+
+def feed_validator(request, queryset):
+    """
+    ETag ленты по отфильтрованной выборке: число рецептов ловит удаления,
+    максимальный updated_at — добавления и изменения. Число рецептов
+    возвращается, чтобы пагинатор не считал его повторно.
+    """
+    feed = queryset.order_by().aggregate(
+        count=Count('pk'), updated_at=Max('updated_at')
+    )
+    return make_etag(
+        *viewer_version(request),
+        feed['count'],
+        feed['updated_at'] and feed['updated_at'].isoformat(),
+    ), feed['count']
+
+
+def page_validator(request, page, *parts):
+    """ETag курсорной страницы по её рецептам: ленту целиком не считаем."""
+    return make_etag(*viewer_version(request), *parts, *(
+        f'{recipe.pk}:{recipe.updated_at.isoformat()}' for recipe in page
+    ))
+
+
+def not_modified(request, etag, last_modified=None):
+    """Ответ 304, если валидаторы клиента совпадают, иначе None."""
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=last_modified and int(last_modified.timestamp()),
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
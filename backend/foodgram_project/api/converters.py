@@ -1,26 +1,9 @@
-def create_report_about_ingredient(ingredient_number, ingredient):
-    return ('''
-            <tr>
-                <th>{ingredient_number}</th>
-                {values}
-                <th>{measurement_unit}</th>
-            </tr>'''.format(
-            ingredient_number=str(ingredient_number),
-            values=(
-                ''.join(
-                    ('<th>{}</th>'.format(str(value)))
-                    for key, value in ingredient.items()
-                    if value and key != 'recipe__ingredients__measurement_unit'
-                )
-            ),
-            measurement_unit=str(
-                ingredient['recipe__ingredients__measurement_unit']
-            )))
-
-
-def create_full_report_about_ingredient(ingredients_data):
-    header = (
-        '''
+import csv
+import io
+
+from django.utils.html import escape
+
+HTML_HEADER = '''
             <style>
                 table {
                     width: 100%; /* Ширина таблицы */
@@ -46,16 +29,49 @@ def create_full_report_about_ingredient(ingredients_data):
                     <th><b>Продукт</b></th>
                     <th><b>Количество</b></th>
                     <th><b>Мера</b></th>
-                </tr>
-        '''
-    )
-    products_list = [
-        create_report_about_ingredient(
-            ingredient_number, ingredient
-        ) for ingredient_number, ingredient
-        in enumerate(ingredients_data, start=1)
-    ]
-    end_tag = '</table>'
-    products_list.insert(0, header)
-    products_list.append(end_tag)
-    return products_list
+                </tr>'''
+
+HTML_ROW = '''
+            <tr>
+                <th>{number}</th>
+                <th>{name}</th>
+                <th>{amount}</th>
+                <th>{measurement_unit}</th>
+            </tr>'''
+
+
+def shopping_list_txt(rows):
+    for number, (name, measurement_unit, amount) in enumerate(rows, start=1):
+        yield f'{number}. {name} ({measurement_unit}) — {amount}\n'
+
+
+def shopping_list_csv(rows):
+    """BOM в начале нужен, чтобы Excel открыл файл в UTF-8."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(('Продукт', 'Количество', 'Мера'))
+    yield '\ufeff' + buffer.getvalue()
+    for name, measurement_unit, amount in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow((name, amount, measurement_unit))
+        yield buffer.getvalue()
+
+
+def shopping_list_html(rows):
+    yield HTML_HEADER
+    for number, (name, measurement_unit, amount) in enumerate(rows, start=1):
+        yield HTML_ROW.format(
+            number=number,
+            name=escape(name),
+            amount=amount,
+            measurement_unit=escape(measurement_unit),
+        )
+    yield '\n            </table>\n'
+
+
+EXPORT_FORMATS = {
+    'txt': (shopping_list_txt, 'text/plain'),
+    'csv': (shopping_list_csv, 'text/csv'),
+    'html': (shopping_list_html, 'text/html'),
+}
@@ -0,0 +1,71 @@
+import hashlib
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from .catalog import get_catalog_version
+from .conditional import not_modified, set_validators
+from .versions import bump_version, get_version
+
+FEED_VERSION_KEY = 'feed-version'
+FEED_CACHE_PARAMS = ('page', 'limit', 'tags', 'author')
+
+
+def bump_feed_version():
+    """Все закэшированные страницы и рецепты устаревают."""
+    bump_version(FEED_VERSION_KEY)
+
+
+def feed_cache_key(request, recipe_id=None):
+    """
+    Ключ ответа для анонимного пользователя или None, если запрос
+    не кэшируется: для авторизованных ответ зависит от зрителя, а
+    неизвестные параметры могли бы раздуть кэш.
+    """
+    if request.user.is_authenticated:
+        return None
+    params = request.GET
+    if recipe_id is not None:
+        if params:
+            return None
+        normalized = [('recipe', recipe_id)]
+    else:
+        if set(params) - set(FEED_CACHE_PARAMS):
+            return None
+        normalized = [('tags', tag) for tag in sorted(set(
+            params.getlist('tags')
+        ))]
+        for name, default in (
+            ('page', '1'),
+            ('limit', settings.REST_FRAMEWORK['PAGE_SIZE']),
+            ('author', ''),
+        ):
+            values = params.getlist(name)
+            if len(values) > 1 or values and not values[0].isdigit():
+                return None
+            normalized.append(
+                (name, int(values[0]) if values else default)
+            )
+    return 'feed:{}:{}:{}'.format(
+        get_version(FEED_VERSION_KEY),
+        get_catalog_version(),
+        hashlib.md5(urlencode(
+            [('host', request.get_host())] + normalized
+        ).encode()).hexdigest(),
+    )
+
+
+def get_cached_response(request, key):
+    cached = caches[settings.FEED_CACHE].get(key)
+    if cached is None:
+        return None
+    data, etag, last_modified = cached
+    return not_modified(request, etag, last_modified) or set_validators(
+        Response(data), etag, last_modified
+    )
+
+
+def cache_response(key, data, etag, last_modified=None):
+    caches[settings.FEED_CACHE].set(key, (data, etag, last_modified))
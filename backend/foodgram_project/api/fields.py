@@ -1,6 +1,8 @@
 import webcolors
 from rest_framework import serializers
 
+from recipes.images import image_url
+
 
 class Hex2NameColor(serializers.Field):
     def to_representation(self, value):
@@ -12,3 +14,24 @@ class Hex2NameColor(serializers.Field):
         except ValueError:
             raise serializers.ValidationError('Для этого цвета нет имени.')
         return data
+
+
+class RecipeImageField(serializers.Field):
+    """
+    Адрес варианта фото рецепта. Если вариант не задан, его выбирает
+    представление через контекст image_variant.
+    """
+
+    def __init__(self, variant=None, **kwargs):
+        self.variant = variant
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        url = image_url(
+            recipe, self.variant or self.context.get('image_variant', 'full')
+        )
+        request = self.context.get('request')
+        if url is None or request is None:
+            return url
+        return request.build_absolute_uri(url)
@@ -8,6 +8,7 @@ from recipes.models import (
     Recipe,
     Tag,
 )
+from recipes.search import search_recipes
 
 
 class RecipeFilter(FilterSet):
@@ -26,6 +27,7 @@ class RecipeFilter(FilterSet):
         field_name='is_in_shopping_cart',
         method='filter_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
@@ -34,6 +36,7 @@ class RecipeFilter(FilterSet):
             'tags',
             'is_favorited',
             'is_in_shopping_cart',
+            'search',
         )
 
     def filter_is_favorited(self, queryset, name, value):
@@ -46,6 +49,9 @@ class RecipeFilter(FilterSet):
             return queryset.filter(shoppingcart__user=self.request.user)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
 
 class IngredientFilter(FilterSet):
     name = filters.CharFilter(lookup_expr='istartswith')
@@ -0,0 +1,108 @@
+"""
+Повтор запроса с тем же заголовком Idempotency-Key не выполняет его ещё
+раз, а возвращает запомненный ответ. Ключ принадлежит пользователю; тот
+же ключ с другим методом, адресом или телом отклоняется.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+IN_PROGRESS_TIMEOUT = 60
+KEY_TOO_LONG_MESSAGE = 'Ключ Idempotency-Key длиннее {} символов.'
+IN_PROGRESS_MESSAGE = 'Запрос с этим ключом ещё выполняется.'
+KEY_REUSED_MESSAGE = 'Ключ уже использован для другого запроса.'
+
+
+def request_fingerprint(request):
+    return hashlib.sha256(json.dumps(
+        [request.method, request.path, request.data],
+        sort_keys=True, default=str,
+    ).encode()).hexdigest()
+
+
+def acquire_key(user_id, key, fingerprint):
+    """
+    Занимает ключ вставкой строки: из параллельных запросов её вставит
+    только один. Возвращает (строка, занят ли ключ этим запросом).
+    Просроченные ключи пользователя и зависшие незавершённые удаляются.
+    """
+    now = timezone.now()
+    IdempotencyKey.objects.filter(user_id=user_id).filter(
+        Q(created_at__lt=now - timedelta(
+            seconds=settings.IDEMPOTENCY_KEY_TIMEOUT
+        ))
+        | Q(
+            status_code__isnull=True,
+            created_at__lt=now - timedelta(seconds=IN_PROGRESS_TIMEOUT),
+        )
+    ).delete()
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(
+                user_id=user_id, key=key, fingerprint=fingerprint
+            ), True
+    except IntegrityError:
+        return IdempotencyKey.objects.filter(
+            user_id=user_id, key=key
+        ).first(), False
+
+
+def idempotent(view):
+    """
+    Декоратор действия ViewSet. Запоминаются только успешные ответы:
+    после ошибки повтор с тем же ключом выполняет запрос заново.
+    """
+    @wraps(view)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view(self, request, *args, **kwargs)
+        if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return Response(
+                {'detail': KEY_TOO_LONG_MESSAGE.format(
+                    IDEMPOTENCY_KEY_MAX_LENGTH
+                )},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        fingerprint = request_fingerprint(request)
+        record, acquired = acquire_key(request.user.id, key, fingerprint)
+        if not acquired:
+            if record is None or record.status_code is None:
+                return Response(
+                    {'detail': IN_PROGRESS_MESSAGE},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            if record.fingerprint != fingerprint:
+                return Response(
+                    {'detail': KEY_REUSED_MESSAGE},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            response = Response(record.response, status=record.status_code)
+            response['Idempotent-Replayed'] = 'true'
+            return response
+        try:
+            response = view(self, request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+        if response.status_code < 400:
+            record.status_code = response.status_code
+            record.response = response.data
+            record.save(update_fields=('status_code', 'response'))
+        else:
+            record.delete()
+        return response
+
+    return wrapper
@@ -0,0 +1,683 @@
+import base64
+import csv
+import io
+import itertools
+import json
+import random
+import re
+import tempfile
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext,
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from api.paginator import RecipeResultsSetPagination
+from api.shopping_list import aggregate_shopping_list, shopping_list_rows
+from recipes.counters import reconcile_in_batches
+from recipes.models import (
+    Favorite,
+    Follow,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Tag,
+    User,
+)
+from recipes.search import update_search_index
+from recipes.shopping_list import rebuild_shopping_lists
+
+Case = namedtuple(
+    'Case', 'name method url data auth max_queries status max_ms'
+)
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+PAGE_LIMIT = 50
+VIEWER_FAVORITES = 150
+BULK_ITEMS = 20
+VIEWER_CART = 120
+VIEWER_FOLLOWS = 200
+READ_MAX_MS = 500
+WRITE_MAX_MS = 1000
+PLAN_CHECKED_CASES = ('recipes-list', 'recipes-cursor')
+RECIPE_TABLE = '"recipes_recipe"'
+SHOPPING_LIST_CHECKS = ('shopping-list-totals', 'shopping-list-aggregate')
+LARGE_TABLES = {
+    'recipes_recipe',
+    'recipes_recipe_tags',
+    'recipes_recipeingredient',
+    'recipes_favorite',
+    'recipes_shoppingcart',
+    'recipes_follow',
+}
+SEQUENTIAL_SCAN = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'^SCAN (?:TABLE )?(\w+)(?!.* USING )'),
+}
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = max(0, round(percent / 100 * len(ordered) + 0.5) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def make_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (206, 231, 65)).save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+class Command(BaseCommand):
+    help = (
+        'Наполняет тестовую базу данными и проверяет число SQL-запросов и '
+        'время ответа каждого эндпоинта API. Завершается с ошибкой, если '
+        'бюджет запросов или времени превышен.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--favorites', type=int, default=20000)
+        parser.add_argument('--carts', type=int, default=5000)
+        parser.add_argument('--follows', type=int, default=10000)
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Сколько раз выполнять каждый запрос.'
+        )
+        parser.add_argument(
+            '--time-factor', type=float, default=1.0,
+            help='Множитель для бюджетов времени ответа.'
+        )
+        parser.add_argument(
+            '--only', default='',
+            help='Запускать только эндпоинты, имя которых содержит строку.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        setup_test_environment()
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            with override_settings(
+                MEDIA_ROOT=tempfile.mkdtemp(),
+                CACHES={
+                    alias: {
+                        'BACKEND':
+                            'django.core.cache.backends.locmem.LocMemCache',
+                        'LOCATION': alias,
+                    }
+                    for alias in ('default', 'feed', 'versions', 'auth')
+                },
+                IMAGE_WORKERS=0,
+                PASSWORD_HASHERS=[
+                    'django.contrib.auth.hashers.MD5PasswordHasher'
+                ],
+            ):
+                started = time.perf_counter()
+                fixtures = self.seed(options)
+                self.stdout.write(
+                    'Данные созданы за {:.1f} с.'.format(
+                        time.perf_counter() - started
+                    )
+                )
+                cases = self.build_cases(fixtures)
+                failures = self.run_cases(cases, fixtures, options)
+                failures += self.check_query_plans(cases, fixtures, options)
+                if options['only'] in ('', *SHOPPING_LIST_CHECKS):
+                    failures += self.check_shopping_list(fixtures, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        if failures:
+            raise CommandError(
+                'Превышены бюджеты:\n' + '\n'.join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS('Все бюджеты соблюдены.'))
+
+    def seed(self, options):
+        rng = random.Random(options['seed'])
+        data_dir = settings.BASE_DIR / 'data'
+
+        with open(data_dir / 'tags.json', encoding='utf-8') as file:
+            tags = Tag.objects.bulk_create(
+                Tag(**row['fields']) for row in json.load(file)
+            )
+        with open(data_dir / 'ingredients.csv', encoding='utf-8') as file:
+            ingredients = Ingredient.objects.bulk_create(
+                Ingredient(name=name, measurement_unit=unit)
+                for name, unit in csv.reader(file)
+            )
+
+        password = make_password(BENCHMARK_PASSWORD)
+        users = User.objects.bulk_create(
+            User(
+                username=f'user{number}',
+                email=f'user{number}@example.com',
+                first_name='Имя',
+                last_name='Фамилия',
+                password=password,
+            ) for number in range(options['users'])
+        )
+        viewer, other = users[0], users[1]
+        popularity = [1 / rank for rank in range(1, len(users) + 1)]
+
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                name=f'Рецепт {number}',
+                text='Описание рецепта',
+                cooking_time=rng.randint(1, 120),
+                author=rng.choices(users, popularity)[0],
+                image='images/benchmark.png',
+            ) for number in range(options['recipes'])
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in recipes
+            for tag in rng.sample(tags, rng.randint(1, len(tags)))
+        )
+        RecipeIngredient.objects.bulk_create(
+            (
+                RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=ingredient,
+                    amount=rng.randint(1, 500),
+                )
+                for recipe in recipes
+                for ingredient in rng.sample(ingredients, rng.randint(5, 15))
+            ),
+            batch_size=5000,
+        )
+        update_search_index()
+
+        viewer_recipes = rng.sample(
+            recipes[PAGE_LIMIT:], VIEWER_FAVORITES + VIEWER_CART
+        )
+        Favorite.objects.bulk_create(
+            Favorite(user=viewer, recipe=recipe)
+            for recipe in viewer_recipes[:VIEWER_FAVORITES]
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=viewer, recipe=recipe)
+            for recipe in viewer_recipes[-VIEWER_CART:]
+        )
+        Follow.objects.bulk_create(
+            Follow(user=viewer, following=author)
+            for author in users[2:VIEWER_FOLLOWS + 2]
+        )
+        for model, count in (
+            (Favorite, options['favorites']),
+            (ShoppingCart, options['carts']),
+        ):
+            model.objects.bulk_create(
+                (
+                    model(
+                        user=rng.choice(users[2:]),
+                        recipe=rng.choice(recipes),
+                    )
+                    for _ in range(count)
+                ),
+                ignore_conflicts=True,
+                batch_size=5000,
+            )
+        Follow.objects.bulk_create(
+            (
+                Follow(user=user, following=rng.choices(users, popularity)[0])
+                for user in (
+                    rng.choice(users[2:]) for _ in range(options['follows'])
+                )
+            ),
+            ignore_conflicts=True,
+            batch_size=5000,
+        )
+        rebuild_shopping_lists(user.id for user in users)
+        for model, objects in ((Recipe, recipes), (User, users)):
+            reconcile_in_batches(model, (obj.id for obj in objects), 500)
+
+        return {
+            'viewer': viewer,
+            'other': other,
+            'token': Token.objects.create(user=viewer).key,
+            'author': users[2].id,
+            'tags': [tag.slug for tag in tags],
+            'tag_ids': [tag.id for tag in tags],
+            'ingredients': [ingredient.id for ingredient in ingredients[:3]],
+            'recipe': recipes[0].id,
+            'free_recipe': recipes[1].id,
+            'free_author': users[-1].id,
+            'free_recipes': [
+                recipe.id for recipe in recipes[2:BULK_ITEMS + 2]
+            ],
+            'free_authors': [user.id for user in users[-BULK_ITEMS - 1:-1]],
+            'deep_cursor': RecipeResultsSetPagination().encode_cursor(
+                Recipe.objects.order_by('-pub_date', '-id')[len(recipes) // 2]
+            ),
+            'image': make_image(),
+        }
+
+    def build_cases(self, fixtures):
+        def read(name, url, max_queries, auth=False):
+            return [Case(
+                name, 'get', url, None, auth, max_queries, 200, READ_MAX_MS
+            )]
+
+        def write(name, method, url, data, max_queries, status):
+            return Case(
+                name, method, url, data, True, max_queries, status,
+                WRITE_MAX_MS
+            )
+
+        recipe_data = {
+            'name': 'Новый рецепт',
+            'text': 'Описание рецепта',
+            'cooking_time': 10,
+            'image': fixtures['image'],
+            'tags': fixtures['tag_ids'][:2],
+            'ingredients': [
+                {'id': ingredient, 'amount': 10}
+                for ingredient in fixtures['ingredients']
+            ],
+        }
+        filters = {
+            'author': f'author={fixtures["author"]}',
+            'tags': '&'.join(f'tags={slug}' for slug in fixtures['tags'][:2]),
+            'is_favorited': 'is_favorited=1',
+            'is_in_shopping_cart': 'is_in_shopping_cart=1',
+            'search': 'search=Рецепт',
+        }
+        cases = [
+            read('ingredients-list', '/api/ingredients/', 1),
+            read('ingredients-search', '/api/ingredients/?name=ка', 1),
+            read(
+                'ingredients-autocomplete',
+                '/api/ingredients/autocomplete/?name=сок&limit=10', 1
+            ),
+            read(
+                'ingredients-detail',
+                f'/api/ingredients/{fixtures["ingredients"][0]}/', 1
+            ),
+            read('tags-list', '/api/tags/', 1),
+            read('tags-detail', f'/api/tags/{fixtures["tag_ids"][0]}/', 1),
+            read('users-list', f'/api/users/?limit={PAGE_LIMIT}', 2),
+            read(
+                'users-list-auth', f'/api/users/?limit={PAGE_LIMIT}', 4,
+                auth=True
+            ),
+            read('users-detail', f'/api/users/{fixtures["author"]}/', 3,
+                 auth=True),
+            read('users-me', '/api/users/me/', 2, auth=True),
+            read(
+                'subscriptions', '/api/users/subscriptions/?recipes_limit=3',
+                5, auth=True
+            ),
+            read(
+                'recipes-cursor', f'/api/recipes/?limit={PAGE_LIMIT}&cursor=',
+                3
+            ),
+            read(
+                'recipes-cursor-deep',
+                f'/api/recipes/?limit={PAGE_LIMIT}'
+                f'&cursor={fixtures["deep_cursor"]}',
+                3
+            ),
+            read(
+                'recipes-detail', f'/api/recipes/{fixtures["recipe"]}/', 3
+            ),
+            read(
+                'recipes-detail-auth', f'/api/recipes/{fixtures["recipe"]}/',
+                5, auth=True
+            ),
+        ]
+        cases += [
+            read(
+                f'download-shopping-cart-{export_format}',
+                '/api/recipes/download_shopping_cart/'
+                f'?format={export_format}',
+                3, auth=True
+            )
+            for export_format in ('txt', 'csv', 'html')
+        ]
+        for size in range(len(filters) + 1):
+            for combination in itertools.combinations(filters, size):
+                query = '&'.join(
+                    [f'limit={PAGE_LIMIT}']
+                    + [filters[name] for name in combination]
+                )
+                suffix = '+'.join(combination) or 'all'
+                max_queries = 4 + len(
+                    {'author', 'tags'}.intersection(combination)
+                )
+                cases.append(read(
+                    f'recipes-list[{suffix}]',
+                    f'/api/recipes/?{query}',
+                    max_queries,
+                ))
+                cases.append(read(
+                    f'recipes-list-auth[{suffix}]',
+                    f'/api/recipes/?{query}',
+                    max_queries + 2,
+                    auth=True,
+                ))
+        free_recipe = fixtures['free_recipe']
+        free_author = fixtures['free_author']
+        free_recipes = {'recipes': fixtures['free_recipes']}
+        free_authors = {'authors': fixtures['free_authors']}
+        cases += [
+            [
+                write(
+                    'favorite-add', 'post',
+                    f'/api/recipes/{free_recipe}/favorite/', None, 5, 201
+                ),
+                write(
+                    'favorite-remove', 'delete',
+                    f'/api/recipes/{free_recipe}/favorite/', None, 4, 204
+                ),
+            ],
+            [
+                write(
+                    'shopping-cart-add', 'post',
+                    f'/api/recipes/{free_recipe}/shopping_cart/', None, 6, 201
+                ),
+                write(
+                    'shopping-cart-remove', 'delete',
+                    f'/api/recipes/{free_recipe}/shopping_cart/', None, 6, 204
+                ),
+            ],
+            [
+                write(
+                    'subscribe', 'post',
+                    f'/api/users/{free_author}/subscribe/', None, 8, 201
+                ),
+                write(
+                    'unsubscribe', 'delete',
+                    f'/api/users/{free_author}/subscribe/', None, 4, 204
+                ),
+            ],
+            [
+                write(
+                    'bulk-favorite-add', 'post', '/api/recipes/favorite/',
+                    free_recipes, 5, 200
+                ),
+                write(
+                    'bulk-favorite-remove', 'delete', '/api/recipes/favorite/',
+                    free_recipes, 4, 200
+                ),
+            ],
+            [
+                write(
+                    'bulk-shopping-cart-add', 'post',
+                    '/api/recipes/shopping_cart/', free_recipes, 5, 200
+                ),
+                write(
+                    'bulk-shopping-cart-remove', 'delete',
+                    '/api/recipes/shopping_cart/', free_recipes, 6, 200
+                ),
+            ],
+            [
+                write(
+                    'bulk-subscribe', 'post', '/api/users/subscribe/',
+                    free_authors, 4, 200
+                ),
+                write(
+                    'bulk-unsubscribe', 'delete', '/api/users/subscribe/',
+                    free_authors, 4, 200
+                ),
+            ],
+            [
+                write(
+                    'recipe-create', 'post', '/api/recipes/', recipe_data,
+                    20, 201
+                ),
+                write(
+                    'recipe-update', 'patch', '/api/recipes/{created}/',
+                    recipe_data, 26, 200
+                ),
+                write(
+                    'recipe-delete', 'delete', '/api/recipes/{created}/',
+                    None, 14, 204
+                ),
+            ],
+            [
+                Case(
+                    'token-login', 'post', '/api/auth/token/login/',
+                    {
+                        'email': fixtures['other'].email,
+                        'password': BENCHMARK_PASSWORD,
+                    },
+                    False, 6, 200, WRITE_MAX_MS
+                ),
+                Case(
+                    'shopping-cart-fill', 'post',
+                    '/api/recipes/shopping_cart/', free_recipes,
+                    'login', 6, 200, WRITE_MAX_MS
+                ),
+                Case(
+                    'shopping-cart-clear', 'delete',
+                    '/api/recipes/shopping_cart/clear/', None,
+                    'login', 6, 204, WRITE_MAX_MS
+                ),
+                Case(
+                    'token-logout', 'post', '/api/auth/token/logout/', None,
+                    'login', 5, 204, WRITE_MAX_MS
+                ),
+            ],
+        ]
+        return cases
+
+    def run_cases(self, cases, fixtures, options):
+        client = Client()
+        results = {}
+        state = {}
+        failures = []
+        cases = [
+            group for group in cases
+            if any(options['only'] in case.name for case in group)
+        ]
+        for _ in range(options['repeat']):
+            for group in cases:
+                for case in group:
+                    headers = {}
+                    if case.auth == 'login':
+                        headers['HTTP_AUTHORIZATION'] = (
+                            f'Token {state["login"]}'
+                        )
+                    elif case.auth:
+                        headers['HTTP_AUTHORIZATION'] = (
+                            f'Token {fixtures["token"]}'
+                        )
+                    kwargs = {}
+                    if case.method != 'get':
+                        kwargs = {
+                            'data': json.dumps(case.data or {}),
+                            'content_type': 'application/json',
+                        }
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        response = getattr(client, case.method)(
+                            case.url.format(**state), **kwargs, **headers
+                        )
+                        if response.streaming:
+                            b''.join(response.streaming_content)
+                        elapsed = (time.perf_counter() - started) * 1000
+                    if case.name == 'recipe-create':
+                        state['created'] = response.json().get('id')
+                    if case.name == 'token-login':
+                        state['login'] = response.json().get('auth_token')
+                    result = results.setdefault(
+                        case.name,
+                        {'case': case, 'times': [], 'queries': 0,
+                         'statuses': set()}
+                    )
+                    result['times'].append(elapsed)
+                    result['queries'] = max(
+                        result['queries'], len(queries)
+                    )
+                    result['statuses'].add(response.status_code)
+
+        self.stdout.write(
+            '{:64} {:>6} {:>9} {:>8} {:>8} {:>8}'.format(
+                'Эндпоинт', 'Статус', 'Запросы', 'p50, мс', 'p95, мс',
+                'p99, мс'
+            )
+        )
+        for name, result in results.items():
+            case = result['case']
+            times = result['times']
+            p95 = percentile(times, 95)
+            self.stdout.write(
+                '{:64} {:>6} {:>4}/{:<4} {:>8.1f} {:>8.1f} {:>8.1f}'.format(
+                    name,
+                    ','.join(map(str, sorted(result['statuses']))),
+                    result['queries'],
+                    case.max_queries,
+                    percentile(times, 50),
+                    p95,
+                    percentile(times, 99),
+                )
+            )
+            if result['statuses'] != {case.status}:
+                failures.append(
+                    f'{name}: статус {result["statuses"]}, '
+                    f'ожидался {case.status}'
+                )
+            if result['queries'] > case.max_queries:
+                failures.append(
+                    f'{name}: {result["queries"]} SQL-запросов, '
+                    f'бюджет {case.max_queries}'
+                )
+            if p95 > case.max_ms * options['time_factor']:
+                failures.append(
+                    f'{name}: p95 {p95:.1f} мс, '
+                    f'бюджет {case.max_ms * options["time_factor"]:.0f} мс'
+                )
+        return failures
+
+    def check_shopping_list(self, fixtures, options):
+        """
+        Сверяет суммы списка покупок, из готовой таблицы и агрегацией
+        корзины, с подсчётом на Python и измеряет время чтения.
+        """
+        viewer = fixtures['viewer']
+        expected = {}
+        for name, measurement_unit, amount in RecipeIngredient.objects.filter(
+            recipe__shoppingcart__user=viewer
+        ).values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ):
+            key = (name, measurement_unit)
+            expected[key] = expected.get(key, 0) + amount
+        cart_size = ShoppingCart.objects.filter(user=viewer).count()
+        failures = []
+        for name, source in zip(SHOPPING_LIST_CHECKS, (
+            shopping_list_rows, aggregate_shopping_list,
+        )):
+            times = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                rows = list(source(viewer))
+                times.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(
+                '{}: {} рецептов, {} продуктов, p50 {:.1f} мс, '
+                'p95 {:.1f} мс.'.format(
+                    name,
+                    cart_size,
+                    len(rows),
+                    percentile(times, 50),
+                    percentile(times, 95),
+                )
+            )
+            totals = {
+                (ingredient, measurement_unit): amount
+                for ingredient, measurement_unit, amount in rows
+            }
+            if len(totals) != len(rows) or totals != expected:
+                failures.append(f'{name}: суммы списка покупок неверны')
+        return failures
+
+    def explain(self, sql):
+        """
+        План запроса. В PostgreSQL последовательное сканирование
+        запрещается, чтобы на небольшой тестовой базе оно оставалось
+        только там, где подходящего индекса нет.
+        """
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET enable_seqscan = off')
+                try:
+                    cursor.execute(f'EXPLAIN {sql}')
+                    return [row[0] for row in cursor.fetchall()]
+                finally:
+                    cursor.execute('RESET enable_seqscan')
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def check_query_plans(self, cases, fixtures, options):
+        """
+        Выполняет каждую комбинацию фильтров ленты один раз и проверяет
+        планы её запросов: большие таблицы должны читаться по индексам.
+        Кэш ленты очищается перед каждым запросом, иначе ответ для
+        анонима придёт из кэша без единого запроса к базе.
+        """
+        pattern = SEQUENTIAL_SCAN.get(connection.vendor)
+        if pattern is None:
+            return []
+        client = Client()
+        failures = []
+        uncaptured = []
+        checked = 0
+        for case in itertools.chain.from_iterable(cases):
+            if (
+                not case.name.startswith(PLAN_CHECKED_CASES)
+                or options['only'] not in case.name
+            ):
+                continue
+            headers = {}
+            if case.auth:
+                headers['HTTP_AUTHORIZATION'] = f'Token {fixtures["token"]}'
+            caches[settings.FEED_CACHE].clear()
+            with CaptureQueriesContext(connection) as queries:
+                client.get(case.url, **headers)
+            selects = [
+                query['sql'] for query in queries.captured_queries
+                if query['sql'].startswith('SELECT')
+            ]
+            if not any(RECIPE_TABLE in sql for sql in selects):
+                uncaptured.append(f'{case.name}: нет запроса к рецептам')
+            for sql in selects:
+                checked += 1
+                scanned = {
+                    match.group(1)
+                    for line in self.explain(sql)
+                    if (match := pattern.search(line))
+                } & LARGE_TABLES
+                if scanned:
+                    failures.append(
+                        '{}: последовательное чтение {}\n{}'.format(
+                            case.name, ', '.join(sorted(scanned)),
+                            sql,
+                        )
+                    )
+        if checked:
+            self.stdout.write(
+                f'Планы запросов: проверено {checked}, '
+                f'с последовательным чтением {len(failures)}.'
+            )
+        return failures + uncaptured
@@ -0,0 +1,95 @@
+import math
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(values, fraction):
+    return values[max(0, math.ceil(len(values) * fraction) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагружает запущенный сервер параллельными клиентами и выводит '
+        'пропускную способность и перцентили времени ответа. Несколько '
+        '--url прогоняются по очереди, например, чтобы сравнить WSGI '
+        'и ASGI: --url wsgi=http://localhost:7000/api/recipes/ '
+        '--url asgi=http://localhost:7001/api/recipes/.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', action='append', required=True,
+            help='Адрес в виде метка=URL или просто URL.'
+        )
+        parser.add_argument('--token', help='Токен пользователя.')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument(
+            '--duration', type=float, default=10,
+            help='Длительность прогона каждого адреса в секундах.'
+        )
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        headers = {'Accept': 'application/json'}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+        self.stdout.write(
+            f'{"адрес":<16}{"запросов":>10}{"RPS":>10}'
+            f'{"p50, мс":>10}{"p99, мс":>10}{"ошибок":>8}'
+        )
+        for value in options['url']:
+            label, url = (
+                (value, value) if value.startswith('http')
+                else value.split('=', 1)
+            )
+            self.warm_up(url, headers, options['timeout'])
+            timings, errors, elapsed = self.run(url, headers, options)
+            if not timings:
+                raise CommandError(f'{url}: нет успешных ответов.')
+            timings.sort()
+            self.stdout.write(
+                f'{label[:15]:<16}{len(timings):>10}'
+                f'{len(timings) / elapsed:>10.1f}'
+                f'{statistics.median(timings) * 1000:>10.1f}'
+                f'{percentile(timings, 0.99) * 1000:>10.1f}{errors:>8}'
+            )
+
+    def warm_up(self, url, headers, timeout):
+        try:
+            self.fetch(url, headers, timeout)
+        except (HTTPError, URLError) as error:
+            raise CommandError(f'{url}: {error}')
+
+    def fetch(self, url, headers, timeout):
+        with urlopen(Request(url, headers=headers), timeout=timeout) as r:
+            r.read()
+
+    def run(self, url, headers, options):
+        deadline = time.perf_counter() + options['duration']
+
+        def client(_):
+            timings, errors = [], 0
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    self.fetch(url, headers, options['timeout'])
+                except (HTTPError, URLError, OSError):
+                    errors += 1
+                    continue
+                timings.append(time.perf_counter() - started)
+            return timings, errors
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(client, range(options['concurrency'])))
+        elapsed = time.perf_counter() - started
+        return (
+            [timing for timings, _ in results for timing in timings],
+            sum(errors for _, errors in results),
+            elapsed,
+        )
@@ -0,0 +1,37 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from recipes.images import process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Готовит варианты фото рецептов, которые ещё не обработаны: '
+        'загруженных при IMAGE_WORKERS = 0, через админку или в обход API, '
+        'а также тех, чья обработка прервалась.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        recipe_ids = list(Recipe.objects.filter(
+            image_processed=False
+        ).exclude(image='').order_by('id').values_list('id', flat=True))
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            processed = sum(executor.map(self.process, recipe_ids))
+        self.stdout.write(
+            f'Обработано фото: {processed} из {len(recipe_ids)}.'
+        )
+
+    def process(self, recipe_id):
+        try:
+            return process_recipe_image(recipe_id)
+        except Exception as error:
+            self.stderr.write(f'Рецепт {recipe_id}: {error}')
+            return False
+        finally:
+            connection.close()
@@ -0,0 +1,40 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.db.models import UniqueConstraint
+from django.utils import timezone
+
+from recipes.models import User
+
+
+class IdempotencyKey(models.Model):
+    """
+    Ключ Idempotency-Key пользователя и запомненный ответ. Уникальность
+    пары пользователь-ключ гарантирует база, поэтому из параллельных
+    запросов с одним ключом выполняется только один.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Пользователь',
+    )
+    key = models.CharField('Ключ', max_length=255)
+    fingerprint = models.CharField('Отпечаток запроса', max_length=64)
+    status_code = models.PositiveSmallIntegerField(
+        'Код ответа', null=True
+    )
+    response = models.JSONField(
+        'Ответ', null=True, encoder=DjangoJSONEncoder
+    )
+    created_at = models.DateTimeField('Создан', default=timezone.now)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'key'],
+                name='unique_idempotency_key',
+            ),
+        ]
+        verbose_name = 'Ключ идемпотентности'
+        verbose_name_plural = 'Ключи идемпотентности'
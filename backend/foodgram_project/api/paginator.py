@@ -1,11 +1,134 @@
+import base64
+import binascii
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import (
     PageNumberPagination,
 )
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPaginationMixin:
+    """
+    Курсорный режим по запросу с параметром cursor (для первой страницы
+    пустым): следующая страница выбирается условием по ключу
+    keyset_ordering последнего показанного объекта, без OFFSET и COUNT,
+    и не сдвигается при появлении новых объектов. Размер страницы задаётся
+    тем же параметром, что и в постраничном режиме.
+    """
+
+    cursor_query_param = 'cursor'
+    keyset_ordering = None
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def is_keyset(self, request):
+        return self.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.is_keyset(request)
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.keyset_ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.after(position))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+        page = list(queryset[:page_size + 1])
+        self.next_cursor = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_cursor = self.encode_cursor(page[-1])
+        return page
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_cursor_link(),
+            'results': data,
+        })
+
+    def after(self, position):
+        """Строки после позиции в порядке keyset_ordering."""
+        conditions = []
+        for index, field in enumerate(self.keyset_ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            conditions.append(Q(
+                **{
+                    previous.lstrip('-'): value
+                    for previous, value in zip(
+                        self.keyset_ordering[:index], position
+                    )
+                },
+                **{f'{name}__{lookup}': position[index]},
+            ))
+        return reduce(or_, conditions)
+
+    @staticmethod
+    def key_value(obj, field):
+        value = obj
+        for attribute in field.lstrip('-').split('__'):
+            value = getattr(value, attribute)
+        return value.isoformat() if hasattr(value, 'isoformat') else value
+
+    def decode_cursor(self, request):
+        encoded = request.query_params[self.cursor_query_param]
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if (
+            not isinstance(position, list)
+            or len(position) != len(self.keyset_ordering)
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, obj):
+        return base64.urlsafe_b64encode(json.dumps([
+            self.key_value(obj, field) for field in self.keyset_ordering
+        ]).encode()).decode()
+
+    def get_next_cursor_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.next_cursor,
+        )
 
 
 class ResultsSetPagination(PageNumberPagination):
     page_size_query_param = 'limit'
+    known_count = None
+
+    def django_paginator_class(self, object_list, per_page):
+        """Не пересчитывает объекты, если их число уже известно."""
+        paginator = Paginator(object_list, per_page)
+        if self.known_count is not None:
+            paginator.count = self.known_count
+        return paginator
+
+
+class RecipeResultsSetPagination(KeysetPaginationMixin, ResultsSetPagination):
+    keyset_ordering = ('-pub_date', '-id')
 
 
-class FollowResultsSetPagination(PageNumberPagination):
+class FollowResultsSetPagination(KeysetPaginationMixin, ResultsSetPagination):
     page_size_query_param = 'recipes_limit'
+    keyset_ordering = ('following__username', 'id')
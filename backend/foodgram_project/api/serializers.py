@@ -1,19 +1,37 @@
+from django.db import transaction
 from djoser.serializers import UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from .fields import Hex2NameColor
+from .fields import Hex2NameColor, RecipeImageField
+from recipes.images import schedule_image_processing
 from recipes.models import (
-    Favorite,
     Follow,
     Recipe,
     RecipeIngredient,
-    ShoppingCart,
     Ingredient,
     Tag,
     User,
 )
+from recipes.search import update_search_index
+from recipes.shopping_list import update_shopping_lists
+
+BULK_MAX_ITEMS = 100
+
+
+def get_followed_ids(request):
+    """
+    Возвращает множество id авторов, на которых подписан пользователь.
+
+    Множество вычисляется одним запросом и запоминается на объекте
+    запроса, поэтому все сериализаторы ответа используют общий результат.
+    """
+    if not hasattr(request, 'followed_ids'):
+        request.followed_ids = set(
+            request.user.followers.values_list('following_id', flat=True)
+        )
+    return request.followed_ids
 
 
 class AuthorSerializer(UserSerializer):
@@ -27,7 +45,7 @@ class AuthorSerializer(UserSerializer):
         request = self.context['request']
         return (
             request.user.is_authenticated
-            and request.user.followers.filter(following=user).exists()
+            and user.id in get_followed_ids(request)
         )
 
 
@@ -77,14 +95,14 @@ class RecipeIngredientWriteSerializer(serializers.ModelSerializer):
 
 
 class RecipeReadSerializer(serializers.ModelSerializer):
-    image = Base64ImageField()
+    image = RecipeImageField()
     author = AuthorSerializer(many=False, read_only=True)
     ingredients = RecipeIngredientReadSerializer(
         many=True, source='recipe_ingredients'
     )
     tags = TagSerializer(many=True)
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
+    is_favorited = serializers.BooleanField(read_only=True)
+    is_in_shopping_cart = serializers.BooleanField(read_only=True)
 
     class Meta:
         model = Recipe
@@ -101,22 +119,6 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
         )
 
-    def get_is_favorited(self, recipe):
-        request = self.context['request']
-        return (
-            request
-            and request.user.is_authenticated
-            and request.user.favorite.filter(recipe=recipe).exists()
-        )
-
-    def get_is_in_shopping_cart(self, recipe):
-        request = self.context['request']
-        return (
-            request
-            and request.user.is_authenticated
-            and request.user.shoppingcart.filter(recipe=recipe).exists()
-        )
-
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
@@ -143,9 +145,12 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         )
 
     def to_representation(self, instance):
+        request = self.context.get('request')
         return RecipeReadSerializer(
-            instance,
-            context={'request': self.context.get('request')}
+            Recipe.objects.with_related().with_user_flags(
+                request.user
+            ).get(pk=instance.pk),
+            context={'request': request}
         ).data
 
     def validate(self, data):
@@ -181,6 +186,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             ) for ingredient in ingredients
         )
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('recipe_ingredients')
         tags_data = validated_data.pop('tags')
@@ -190,20 +196,31 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         )
         recipe.tags.set(tags_data)
         self.create_ingredients(ingredients, recipe)
+        update_search_index([recipe.id])
+        schedule_image_processing(recipe.id)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags_data = validated_data.pop('tags')
         instance.tags.clear()
         instance.tags.set(tags_data)
 
         ingredients_data = validated_data.pop('recipe_ingredients')
+        update_shopping_lists(instance.id, -1)
         recipe_ingredients = instance.recipe_ingredients.all()
         recipe_ingredients.delete()
 
         self.create_ingredients(ingredients_data, instance)
+        update_shopping_lists(instance.id, 1)
 
-        return super().update(instance, validated_data)
+        if 'image' in validated_data:
+            validated_data['image_processed'] = False
+        instance = super().update(instance, validated_data)
+        update_search_index([instance.id])
+        if not instance.image_processed:
+            schedule_image_processing(instance.id)
+        return instance
 
 
 class RecipesWriteFromFollowingSerializer(RecipeWriteSerializer):
@@ -223,7 +240,7 @@ class RecipesReadFromFollowingSerializer(RecipeReadSerializer):
         read_only=True
     )
     name = serializers.CharField(read_only=True)
-    image = Base64ImageField(read_only=True)
+    image = RecipeImageField(variant='thumbnail')
     cooking_time = serializers.IntegerField(
         read_only=True
     )
@@ -241,8 +258,7 @@ class RecipesReadFromFollowingSerializer(RecipeReadSerializer):
 class FollowSerializer(AuthorSerializer):
     recipes = serializers.SerializerMethodField()
     recipes_count = serializers.IntegerField(
-        source='following.recipes.count',
-        read_only=True
+        source='following.recipes_count', read_only=True
     )
 
     class Meta:
@@ -269,61 +285,23 @@ class FollowSerializer(AuthorSerializer):
 
         return representation
 
-    def validate(self, data):
-        request = self.context['request']
-        following = data.get('following')
-        if Follow.objects.filter(
-            user=request.user,
-            following=following.id
-        ).exists():
-            raise ValidationError('Вы уже подписаны на этого автора.')
-        if request.user.id == following.id:
-            raise ValidationError('Вы не можете подписаться на себя.')
-        return data
-
     def get_recipes(self, follow):
-        request = self.context['request']
-        recipes_limit = request.query_params.get('recipes_limit')
-        result = follow.following.recipes.all()
-        if recipes_limit and recipes_limit.isdigit():
-            result = result[:int(recipes_limit)]
-        return RecipesReadFromFollowingSerializer(result, many=True).data
-
-
-class BaseShoppingCartAndFavoriteSerializer(serializers.ModelSerializer):
-
-    class Meta:
-        fields = (
-            'user',
-            'recipe',
-        )
-
-    def to_representation(self, instance):
         return RecipesReadFromFollowingSerializer(
-            instance.recipe,
-            context={'request': self.context.get('request')}
+            follow.following.latest_recipes, many=True
         ).data
 
-    def validate(self, data):
-        request = self.context['request']
-        recipe_id = data.get('id')
-
-        if self.Meta.model.objects.filter(
-            user=request.user,
-            recipe__id=recipe_id
-        ).exists():
-            raise ValidationError('Рецепт уже добавлен в список покупок')
 
-        return data
-
-
-class ShoppingCartSerializer(BaseShoppingCartAndFavoriteSerializer):
+def bulk_ids_field():
+    return serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1,
+        max_length=BULK_MAX_ITEMS,
+    )
 
-    class Meta(BaseShoppingCartAndFavoriteSerializer.Meta):
-        model = ShoppingCart
 
+class BulkRecipesSerializer(serializers.Serializer):
+    recipes = bulk_ids_field()
 
-class FavoriteSerializer(BaseShoppingCartAndFavoriteSerializer):
 
-    class Meta(BaseShoppingCartAndFavoriteSerializer.Meta):
-        model = Favorite
+class BulkAuthorsSerializer(serializers.Serializer):
+    authors = bulk_ids_field()
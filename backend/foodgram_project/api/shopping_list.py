@@ -0,0 +1,99 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Sum
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
+
+from .conditional import not_modified
+from .converters import EXPORT_FORMATS
+from recipes.models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+SHOPPING_LIST_FILENAME = 'shopping_list.{}'
+
+
+def cart_digest(user):
+    """
+    Отпечаток корзины: рецепты и время их изменения. Пока он не
+    изменился, список покупок остаётся тем же.
+    """
+    cart = ShoppingCart.objects.filter(user=user).order_by(
+        'recipe_id'
+    ).values_list('recipe_id', 'recipe__updated_at')
+    return hashlib.md5(''.join(
+        f'{recipe_id}:{updated_at.isoformat()};'
+        for recipe_id, updated_at in cart
+    ).encode()).hexdigest()
+
+
+def shopping_list_rows(user):
+    """Готовый список покупок читается по индексу пользователя."""
+    return ShoppingListItem.objects.filter(user=user).order_by(
+        'ingredient__name', 'ingredient_id'
+    ).values_list(
+        'ingredient__name', 'ingredient__measurement_unit', 'total_amount'
+    ).iterator()
+
+
+def aggregate_shopping_list(user):
+    """
+    Суммы продуктов по корзине одним GROUP BY по продуктам рецептов:
+    группировка по id продукта, чтобы одноимённые продукты с разными
+    мерами не сливались.
+    """
+    return RecipeIngredient.objects.filter(
+        recipe__in=ShoppingCart.objects.filter(user=user).values('recipe')
+    ).values(
+        'ingredient',
+        'ingredient__name',
+        'ingredient__measurement_unit',
+    ).annotate(
+        total_amount=Sum('amount'),
+    ).order_by('ingredient__name', 'ingredient_id').values_list(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        'total_amount',
+    ).iterator()
+
+
+def stream_and_cache(key, chunks):
+    """Отдаёт части файла по мере готовности и кэширует файл целиком."""
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    cache.set(key, ''.join(parts))
+
+
+def export_shopping_list(request, export_format):
+    """
+    Файл со списком покупок. Одинаковые корзины дают один и тот же файл,
+    поэтому он кэшируется по отпечатку корзины и формату, а повторная
+    загрузка стоит одного лёгкого запроса.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValidationError({'format': [
+            'Доступные форматы: {}.'.format(', '.join(EXPORT_FORMATS))
+        ]})
+    render, content_type = EXPORT_FORMATS[export_format]
+    digest = cart_digest(request.user)
+    etag = f'"{digest}-{export_format}"'
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    key = f'shopping-list:{export_format}:{digest}'
+    content = cache.get(key)
+    if content is None:
+        response = StreamingHttpResponse(
+            stream_and_cache(key, render(shopping_list_rows(request.user))),
+            content_type=f'{content_type}; charset=utf-8',
+        )
+    else:
+        response = HttpResponse(
+            content, content_type=f'{content_type}; charset=utf-8'
+        )
+    response['ETag'] = etag
+    response['Content-Disposition'] = 'attachment; filename="{}"'.format(
+        SHOPPING_LIST_FILENAME.format(export_format)
+    )
+    return response
@@ -0,0 +1,102 @@
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import bump_user_version, remember_token_owner
+from .catalog import bump_catalog_version
+from .feed_cache import bump_feed_version
+from recipes.counters import counter_delta, forget_user
+from recipes.images import image_processed
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag, User
+from recipes.shopping_list import update_shopping_lists
+
+
+@receiver((post_save, post_delete), sender=User)
+def user_changed(instance, **kwargs):
+    bump_user_version(instance.id)
+
+
+@receiver(post_save, sender=Token)
+def token_created(instance, created, **kwargs):
+    if created:
+        remember_token_owner(instance.key, instance.user_id)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(instance, **kwargs):
+    """Без этого сигнала отозванный токен жил бы в кэшах до TOKEN_CACHE_TTL."""
+    bump_user_version(instance.user_id)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def catalog_changed(**kwargs):
+    bump_catalog_version()
+
+
+@receiver((post_save, pre_delete), sender=Tag)
+def tag_changed(instance, **kwargs):
+    Recipe.objects.filter(tags=instance).touch()
+
+
+@receiver((post_save, pre_delete), sender=Ingredient)
+def ingredient_changed(instance, **kwargs):
+    Recipe.objects.filter(recipe_ingredients__ingredient=instance).touch()
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+def recipe_changed(**kwargs):
+    """
+    Продукты рецепта удаляются только вместе с сохранением или удалением
+    самого рецепта, поэтому post_delete для них не нужен: он лишил бы
+    каскадное удаление быстрого пути.
+    """
+    bump_feed_version()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(instance, created, **kwargs):
+    if created:
+        User.objects.filter(id=instance.author_id).update(
+            recipes_count=counter_delta('recipes_count', 1)
+        )
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    """Корзины удаляются каскадно, без сигналов, поэтому вычитаем заранее."""
+    update_shopping_lists(instance.id, -1)
+    User.objects.filter(id=instance.author_id).update(
+        recipes_count=counter_delta('recipes_count', -1)
+    )
+
+
+@receiver(image_processed, sender=Recipe)
+def recipe_image_processed(**kwargs):
+    """Лента начинает отдавать варианты фото вместо исходного файла."""
+    bump_feed_version()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(action, **kwargs):
+    if action.startswith('post_'):
+        bump_feed_version()
+
+
+@receiver(post_save, sender=User)
+def author_changed(instance, created, update_fields=None, **kwargs):
+    """Вход в систему меняет только last_login и не влияет на рецепты."""
+    if not created and update_fields != frozenset({'last_login'}):
+        Recipe.objects.filter(author=instance).touch()
+        bump_feed_version()
+
+
+@receiver(pre_delete, sender=User)
+def user_deleted(instance, **kwargs):
+    forget_user(instance)
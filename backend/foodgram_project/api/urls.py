@@ -1,13 +1,17 @@
+from django.conf import settings
 from django.conf.urls import include
 from django.urls import path
 from rest_framework.routers import DefaultRouter
 
+from . import async_views
 from .views import (
     FollowViewSet,
     IngredientViewSet,
     RecipeViewSet,
     TagViewSet,
     UserViewSet,
+    auth_cache_stats,
+    db_pool_stats,
 )
 
 router = DefaultRouter()
@@ -29,5 +33,18 @@ router.register('users', UserViewSet)
 
 urlpatterns = [
     path('auth/', include('djoser.urls.authtoken')),
+    path('auth-cache/', auth_cache_stats),
+    path('db-pool/', db_pool_stats),
     path('', include(router.urls)),
 ]
+
+if settings.ASYNC_READ_VIEWS:
+    urlpatterns = [
+        path('recipes/', async_views.recipe_list),
+        path('recipes/<int:pk>/', async_views.recipe_detail),
+        path('tags/', async_views.tag_list),
+        path('tags/<int:pk>/', async_views.tag_detail),
+        path('ingredients/', async_views.ingredient_list),
+        path('ingredients/<int:pk>/', async_views.ingredient_detail),
+        path('users/subscriptions/', async_views.subscriptions),
+    ] + urlpatterns
@@ -0,0 +1,25 @@
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+def get_version(key, alias=None):
+    """
+    Версия данных в общем кэше; по ней процессы узнают, что их
+    локальные копии устарели. По умолчанию версии хранятся в кэше
+    VERSION_CACHE, где их не вытесняют другие записи.
+    """
+    cache = caches[alias or settings.VERSION_CACHE]
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key, alias=None):
+    """Новая версия назначается после фиксации транзакции."""
+    cache = caches[alias or settings.VERSION_CACHE]
+    transaction.on_commit(lambda: cache.set(key, uuid4().hex, None))
@@ -1,48 +1,153 @@
-from django.db.models import Sum
-from django.http import FileResponse
+import os
+
+from django.db import transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from rest_framework import status, viewsets
-from rest_framework.decorators import action
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import (
     AllowAny,
+    IsAdminUser,
     IsAuthenticated,
     IsAuthenticatedOrReadOnly,
 )
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
-from .converters import create_full_report_about_ingredient
+from .authentication import token_cache
+from .autocomplete import (
+    AUTOCOMPLETE_LIMIT,
+    AUTOCOMPLETE_MAX_LIMIT,
+    search_ingredients,
+)
+from .catalog import CatalogViewSetMixin, filter_by_name
+from .conditional import (
+    feed_validator,
+    follows_changed,
+    is_conditional,
+    not_modified,
+    page_validator,
+    recipe_validators,
+    set_validators,
+)
+from .feed_cache import cache_response, feed_cache_key, get_cached_response
 from .filters import (
     IngredientFilter,
     RecipeFilter,
 )
+from .idempotency import idempotent
 from .paginator import (
     FollowResultsSetPagination,
+    RecipeResultsSetPagination,
     ResultsSetPagination,
 )
 from .permissions import (
     IsRecipeAuthorOrReadOnly,
 )
+from recipes.bulk import (
+    add_follows,
+    add_user_recipes,
+    remove_follows,
+    remove_user_recipes,
+)
+from recipes.counters import counter_delta, update_follow_counters
 from recipes.models import (
     Favorite,
     Follow,
     Ingredient,
     Recipe,
     ShoppingCart,
+    ShoppingListItem,
     Tag,
     User
 )
+from recipes.search import delete_from_search_index
+from recipes.shopping_list import change_shopping_list
 from .serializers import (
     AuthorSerializer,
-    FavoriteSerializer,
+    BulkAuthorsSerializer,
+    BulkRecipesSerializer,
     FollowSerializer,
     IngredientSerializer,
     RecipeReadSerializer,
+    RecipesReadFromFollowingSerializer,
     RecipeWriteSerializer,
-    ShoppingCartSerializer,
     TagSerializer,
 )
+from .shopping_list import export_shopping_list
+from foodgram_project.postgresql_pool.pool import pool_stats
+
+ALREADY_FOLLOWING_MESSAGE = 'Вы уже подписаны на этого автора.'
+NOT_FOLLOWING_MESSAGE = 'Вы не подписаны на этого автора.'
+SELF_FOLLOW_MESSAGE = 'Вы не можете подписаться на себя.'
+ALREADY_ADDED_MESSAGES = {
+    Favorite: 'Рецепт уже добавлен в избранное.',
+    ShoppingCart: 'Рецепт уже добавлен в список покупок.',
+}
+NOT_ADDED_MESSAGES = {
+    Favorite: 'Рецепта нет в избранном.',
+    ShoppingCart: 'Рецепта нет в списке покупок.',
+}
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def db_pool_stats(request):
+    """Метрики пула соединений воркера, обработавшего запрос."""
+    return Response({'pid': os.getpid(), 'pools': pool_stats()})
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def auth_cache_stats(request):
+    """Попадания в кэш токенов воркера, обработавшего запрос."""
+    return Response({'pid': os.getpid(), **token_cache.stats()})
+
+
+def bulk_results(request, ids, changed, model, exclude=None):
+    """
+    Итог по каждому id пачки. При добавлении: added, exists (уже был
+    в списке), not_found (нет такого объекта в model) или self (подписка
+    на себя); при удалении: removed или absent (не было в списке).
+    """
+    changed = set(changed)
+    if request.method == 'DELETE':
+        return [
+            {'id': pk, 'status': 'removed' if pk in changed else 'absent'}
+            for pk in ids
+        ]
+    rest = [pk for pk in ids if pk not in changed and pk != exclude]
+    existing = set(model.objects.filter(id__in=rest).order_by().values_list(
+        'id', flat=True
+    )) if rest else set()
+    return [
+        {
+            'id': pk,
+            'status': (
+                'added' if pk in changed
+                else 'self' if pk == exclude
+                else 'exists' if pk in existing
+                else 'not_found'
+            ),
+        }
+        for pk in ids
+    ]
+
+
+def get_bulk_ids(request, serializer_class, field):
+    serializer = serializer_class(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    return list(dict.fromkeys(serializer.validated_data[field]))
+
+
+def get_recipes_limit(request):
+    recipes_limit = request.GET.get('recipes_limit')
+    if recipes_limit and recipes_limit.isdigit():
+        return int(recipes_limit)
+    return None
 
 
 class UserViewSet(UserViewSet):
@@ -65,53 +170,94 @@ class UserViewSet(UserViewSet):
         url_path=r'(?P<user_id>\d+)/subscribe',
         permission_classes=[IsAuthenticated],
     )
+    @idempotent
     def create_subscriber(self, request, user_id=None):
-        if request.method == 'DELETE':
-            follow = Follow.objects.filter(
-                user=request.user,
-                following=get_object_or_404(User, id=user_id)
+        user_id = int(user_id)
+        if request.method == 'POST' and user_id == request.user.id:
+            raise ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [SELF_FOLLOW_MESSAGE]}
             )
-            if not follow.exists():
-                return Response(status=status.HTTP_400_BAD_REQUEST)
-            follow.delete()
-
+        with transaction.atomic():
+            changed = self.change_follows(request, [user_id])
+            if changed and request.method == 'POST':
+                # Читается в той же транзакции: параллельная отписка
+                # не успеет удалить подписку до ответа.
+                follow = Follow.objects.with_recipes(
+                    get_recipes_limit(request)
+                ).get(user=request.user, following_id=user_id)
+        if not changed:
+            get_object_or_404(User, id=user_id)
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+                NOT_FOLLOWING_MESSAGE if request.method == 'DELETE'
+                else ALREADY_FOLLOWING_MESSAGE
+            ]})
+        if request.method == 'DELETE':
             return Response(status=status.HTTP_204_NO_CONTENT)
-
-        additional_values = {
-            'user': self.request.user.id,
-            'following': user_id
-        }
-        for key, value in additional_values.items():
-            request.data[key] = value
-        get_object_or_404(User, id=user_id)
-        serializer = FollowSerializer(
-            context={'request': request},
-            data=request.data
-        )
-        serializer.is_valid(raise_exception=True)
-
-        serializer.save()
-
         return Response(
-            serializer.data,
+            FollowSerializer(follow, context={'request': request}).data,
             status=status.HTTP_201_CREATED,
         )
 
+    @staticmethod
+    def change_follows(request, author_ids):
+        """
+        Подписывает (POST) или отписывает от авторов и возвращает тех,
+        для кого подписка действительно изменилась.
+        """
+        user_id = request.user.id
+        if request.method == 'DELETE':
+            changed, delta = remove_follows(user_id, author_ids), -1
+        else:
+            changed, delta = add_follows(user_id, author_ids), 1
+        if changed:
+            update_follow_counters(user_id, changed, delta)
+            follows_changed(user_id)
+        return changed
+
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        url_path='subscribe',
+        permission_classes=[IsAuthenticated],
+    )
+    @idempotent
+    def bulk_subscribe(self, request):
+        author_ids = get_bulk_ids(request, BulkAuthorsSerializer, 'authors')
+        with transaction.atomic():
+            changed = self.change_follows(request, author_ids)
+        return Response({'results': bulk_results(
+            request, author_ids, changed, User, exclude=request.user.id
+        )})
+
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CatalogViewSetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
     permission_classes = (AllowAny,)
     pagination_class = None
+    catalog_name = 'ingredients'
 
+    def filter_catalog(self, items):
+        return filter_by_name(items, self.request.query_params.get('name'))
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+    @action(detail=False, methods=['GET'], url_path='autocomplete')
+    def autocomplete(self, request):
+        limit = request.query_params.get('limit', '')
+        return Response(search_ingredients(
+            request.query_params.get('name', ''),
+            min(int(limit), AUTOCOMPLETE_MAX_LIMIT)
+            if limit.isdigit() else AUTOCOMPLETE_LIMIT
+        ))
+
+
+class TagViewSet(CatalogViewSetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
     permission_classes = (AllowAny, )
+    catalog_name = 'tags'
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
@@ -120,80 +266,179 @@ class RecipeViewSet(viewsets.ModelViewSet):
         DjangoFilterBackend,
     )
     filterset_class = RecipeFilter
+    pagination_class = RecipeResultsSetPagination
 
     permission_classes = (
         IsAuthenticatedOrReadOnly,
         IsRecipeAuthorOrReadOnly
     )
 
+    def get_queryset(self):
+        queryset = Recipe.objects.with_user_flags(self.request.user)
+        if self.action in ('list', 'retrieve'):
+            return queryset.with_related()
+        return queryset
+
+    def get_object(self):
+        """404 с тем же текстом, что и у асинхронного представления."""
+        try:
+            return super().get_object()
+        except Http404:
+            raise NotFound()
+
+    def get_serializer_context(self):
+        """В ленте показываем фото карточного размера."""
+        return {
+            **super().get_serializer_context(),
+            'image_variant': 'card' if self.action == 'list' else 'full',
+        }
+
     def get_serializer_class(self):
         if self.action == 'list' or self.action == 'retrieve':
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
-    @staticmethod
-    def shopping_cart_and_favorite(
-        self,
-        request,
-        recipe_id,
-        modelname,
-        serializername,
-    ):
-        if request.method == 'DELETE':
-            shopping_cart = modelname.objects.filter(
-                user=request.user,
-                recipe=get_object_or_404(Recipe, id=recipe_id)
+    def list(self, request, *args, **kwargs):
+        cache_key = feed_cache_key(request)
+        if cache_key and (
+            response := get_cached_response(request, cache_key)
+        ):
+            return response
+        queryset = self.filter_queryset(self.get_queryset())
+        keyset = self.paginator.is_keyset(request)
+        if keyset:
+            page = self.paginate_queryset(queryset)
+            etag = page_validator(
+                request, page, self.paginator.next_cursor
             )
-            if not shopping_cart.exists():
-                return Response(status=status.HTTP_400_BAD_REQUEST)
-            shopping_cart.delete()
+        else:
+            etag, self.paginator.known_count = feed_validator(
+                request, queryset
+            )
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        if not keyset:
+            page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        response = self.get_paginated_response(serializer.data)
+        if cache_key:
+            cache_response(cache_key, response.data, etag)
+        return set_validators(response, etag)
 
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        additional_values = {
-            'user': self.request.user.id,
-            'recipe': recipe_id
-        }
-        serializer = serializername(
-            context={'request': request},
-            data=additional_values
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_field]
+        cache_key = pk.isdigit() and feed_cache_key(request, int(pk))
+        if cache_key and (
+            response := get_cached_response(request, cache_key)
+        ):
+            return response
+        if is_conditional(request) and pk.isdigit():
+            updated_at = Recipe.objects.filter(pk=pk).values_list(
+                'updated_at', flat=True
+            ).first()
+            if updated_at is not None:
+                response = not_modified(
+                    request, *recipe_validators(request, pk, updated_at)
+                )
+                if response is not None:
+                    return response
+        recipe = self.get_object()
+        data = self.get_serializer(recipe).data
+        etag, last_modified = recipe_validators(
+            request, recipe.pk, recipe.updated_at
+        )
+        if cache_key:
+            cache_response(cache_key, data, etag, last_modified)
+        return set_validators(Response(data), etag, last_modified)
+
+    def perform_destroy(self, instance):
+        delete_from_search_index(instance.id)
+        super().perform_destroy(instance)
+
+    @staticmethod
+    def counter_change(modelname, delta):
+        field = (
+            'cart_count' if modelname is ShoppingCart else 'favorites_count'
         )
+        return {field: counter_delta(field, delta)}
 
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+    def shopping_cart_and_favorite(self, request, recipe_id, modelname):
+        recipe_id = int(recipe_id)
+        with transaction.atomic():
+            changed = self.change_user_recipes(request, modelname, [recipe_id])
+            if changed and request.method == 'POST':
+                # Вставка заблокировала рецепт от удаления до конца
+                # транзакции, поэтому он читается здесь же.
+                recipe = Recipe.objects.get(id=recipe_id)
+        if not changed:
+            get_object_or_404(Recipe, id=recipe_id)
+            messages = (
+                NOT_ADDED_MESSAGES if request.method == 'DELETE'
+                else ALREADY_ADDED_MESSAGES
+            )
+            raise ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [messages[modelname]]}
+            )
+        if request.method == 'DELETE':
+            return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(
-            serializer.data,
+            RecipesReadFromFollowingSerializer(
+                recipe, context={'request': request}
+            ).data,
             status=status.HTTP_201_CREATED,
         )
 
+    def change_user_recipes(self, request, modelname, recipe_ids):
+        """
+        Добавляет (POST) или убирает рецепты из избранного или корзины
+        и возвращает id тех, что действительно добавлены или убраны.
+        """
+        user_id = request.user.id
+        if request.method == 'DELETE':
+            changed = remove_user_recipes(modelname, user_id, recipe_ids)
+            delta = -1
+        else:
+            changed = add_user_recipes(modelname, user_id, recipe_ids)
+            delta = 1
+        if modelname is ShoppingCart:
+            change_shopping_list(user_id, changed, delta)
+        if changed:
+            Recipe.objects.filter(id__in=changed).touch(
+                **self.counter_change(modelname, delta)
+            )
+        return changed
+
     @action(
         detail=False,
         methods=['POST', 'DELETE'],
         url_path=r'(?P<recipe_id>\d+)/shopping_cart',
         permission_classes=[IsAuthenticated]
     )
+    @idempotent
     def shopping_cart(self, request, recipe_id=None):
         return self.shopping_cart_and_favorite(
-            self,
-            request,
-            recipe_id,
-            modelname=ShoppingCart,
-            serializername=ShoppingCartSerializer,
+            request, recipe_id, ShoppingCart
+        )
+
+    def perform_content_negotiation(self, request, force=False):
+        """
+        У выгрузки списка покупок параметр format выбирает формат файла,
+        а не рендерер DRF.
+        """
+        return super().perform_content_negotiation(
+            request, force=force or self.action == 'download_shopping_cart'
         )
 
-    @action(detail=False, methods=['GET'], url_path='download_shopping_cart')
+    @action(
+        detail=False,
+        methods=['GET'],
+        url_path='download_shopping_cart',
+        permission_classes=[IsAuthenticated],
+    )
     def download_shopping_cart(self, request):
-        user = request.user
-        ingredients_data = ShoppingCart.objects.filter(user=user).values(
-            'recipe__ingredients__name',
-            'recipe__ingredients__measurement_unit'
-        ).annotate(
-            ingredient_amount=Sum('recipe__recipe_ingredients__amount'),
-        ).order_by('recipe__ingredients__name')
-
-        return FileResponse(
-            create_full_report_about_ingredient(ingredients_data),
-            as_attachment=True,
-            filename='list.txt'
+        return export_shopping_list(
+            request, request.query_params.get('format', 'txt')
         )
 
     @action(
@@ -202,27 +447,62 @@ class RecipeViewSet(viewsets.ModelViewSet):
         url_path=r'(?P<recipe_id>\d+)/favorite',
         permission_classes=[IsAuthenticated],
     )
+    @idempotent
     def favorite(self, request, recipe_id=None):
-        return self.shopping_cart_and_favorite(
-            self,
-            request,
-            recipe_id,
-            modelname=Favorite,
-            serializername=FavoriteSerializer,
-        )
+        return self.shopping_cart_and_favorite(request, recipe_id, Favorite)
+
+    def bulk_shopping_cart_and_favorite(self, request, modelname):
+        recipe_ids = get_bulk_ids(request, BulkRecipesSerializer, 'recipes')
+        with transaction.atomic():
+            changed = self.change_user_recipes(request, modelname, recipe_ids)
+        return Response({'results': bulk_results(
+            request, recipe_ids, changed, Recipe
+        )})
+
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        url_path='favorite',
+        permission_classes=[IsAuthenticated],
+    )
+    @idempotent
+    def bulk_favorite(self, request):
+        return self.bulk_shopping_cart_and_favorite(request, Favorite)
+
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        url_path='shopping_cart',
+        permission_classes=[IsAuthenticated],
+    )
+    @idempotent
+    def bulk_shopping_cart(self, request):
+        return self.bulk_shopping_cart_and_favorite(request, ShoppingCart)
+
+    @action(
+        detail=False,
+        methods=['DELETE'],
+        url_path='shopping_cart/clear',
+        permission_classes=[IsAuthenticated],
+    )
+    @idempotent
+    def clear_shopping_cart(self, request):
+        with transaction.atomic():
+            recipe_ids = remove_user_recipes(ShoppingCart, request.user.id)
+            ShoppingListItem.objects.filter(user=request.user).delete()
+            if recipe_ids:
+                Recipe.objects.filter(id__in=recipe_ids).touch(
+                    **self.counter_change(ShoppingCart, -1)
+                )
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class FollowViewSet(viewsets.ModelViewSet):
+class FollowViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
     serializer_class = FollowSerializer
     permission_classes = (IsAuthenticated, )
-    pagination_class = ResultsSetPagination
-
-    def get_pagination_class(self):
-        if self.action in ['create', 'list']:
-            return FollowResultsSetPagination
-        return ResultsSetPagination
+    pagination_class = FollowResultsSetPagination
 
     def get_queryset(self):
-        return self.request.user.followers.all().order_by(
-            'following__username'
-        )
+        return self.request.user.followers.with_recipes(
+            get_recipes_limit(self.request)
+        ).order_by(*self.pagination_class.keyset_ordering)
@@ -0,0 +1,43 @@
+"""
+Бекенд PostgreSQL, который берёт соединения из пула процесса и
+возвращает их туда при закрытии, например в конце запроса. Настройки
+пула задаются ключом POOL в settings.DATABASES.
+"""
+from functools import partial
+
+from django.db.backends.postgresql import base, creation
+
+from .pool import clear_pools, get_pool
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    """Свободные соединения пула мешают удалить тестовую базу."""
+
+    def _create_test_db(self, *args, **kwargs):
+        clear_pools()
+        return super()._create_test_db(*args, **kwargs)
+
+    def _destroy_test_db(self, *args, **kwargs):
+        clear_pools()
+        return super()._destroy_test_db(*args, **kwargs)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def get_new_connection(self, conn_params):
+        self.pool = get_pool(
+            self.alias, conn_params, self.settings_dict.get('POOL', {})
+        )
+        return self.pool.checkout(
+            partial(super().get_new_connection, conn_params)
+        )
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            if self.in_atomic_block:
+                self.pool.discard(self.connection)
+            else:
+                self.pool.checkin(self.connection)
@@ -0,0 +1,246 @@
+"""
+Пул соединений с PostgreSQL, общий для потоков одного процесса. Каждый
+воркер gunicorn получает свой пул после fork; в ASGI соединения из пула
+берут потоки, в которых выполняется синхронный код.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from django.db import OperationalError
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_STATUS_IDLE = 0
+POOL_EXHAUSTED_MESSAGE = (
+    'Нет свободных соединений с базой данных: все {} заняты дольше {} с.'
+)
+
+_pools = {}
+_inherited = []
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """
+    Соединения возвращаются в пул вместо закрытия. Перед повторной
+    выдачей соединение, простоявшее дольше check_idle секунд, проверяется
+    запросом SELECT 1; соединения старше max_lifetime и простаивающие
+    дольше max_idle сверх min_size закрываются.
+    """
+
+    def __init__(
+        self, name, min_size, max_size, max_lifetime, max_idle, timeout,
+        check_idle,
+    ):
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self.pid = os.getpid()
+        self.idle = deque()
+        self.opened_at = {}
+        self.size = 0
+        self.waiting = 0
+        self.condition = threading.Condition()
+        self.metrics = dict.fromkeys((
+            'opened', 'reused', 'closed', 'checkouts', 'checkout_failures',
+            'health_check_failures', 'expired', 'waits',
+        ), 0)
+        self.metrics['wait_time'] = 0.0
+        self.metrics['max_wait_time'] = 0.0
+
+    def checkout(self, connect):
+        """Соединение из пула или новое, созданное функцией connect."""
+        started = time.monotonic()
+        waited = 0
+        while True:
+            acquired = time.monotonic()
+            connection, returned_at = self.acquire(started)
+            waited += time.monotonic() - acquired
+            if connection is None:
+                connection = self.open(connect)
+                self.record_checkout(waited)
+                return connection
+            if self.is_usable(connection, returned_at):
+                self.record_checkout(waited, reused=True)
+                return connection
+
+    def acquire(self, started):
+        """
+        Свободное соединение и время его возврата или (None, None), если
+        место под новое соединение зарезервировано.
+        """
+        deadline = started + self.timeout
+        with self.condition:
+            if not self.idle and self.size >= self.max_size:
+                self.metrics['waits'] += 1
+            while not self.idle and self.size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.metrics['checkout_failures'] += 1
+                    raise OperationalError(POOL_EXHAUSTED_MESSAGE.format(
+                        self.max_size, self.timeout
+                    ))
+                self.waiting += 1
+                try:
+                    self.condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            if self.idle:
+                return self.idle.pop()
+            self.size += 1
+            return None, None
+
+    def open(self, connect):
+        try:
+            connection = connect()
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.metrics['checkout_failures'] += 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.opened_at[connection] = time.monotonic()
+            self.metrics['opened'] += 1
+        return connection
+
+    def record_checkout(self, waited, reused=False):
+        with self.condition:
+            self.metrics['checkouts'] += 1
+            self.metrics['reused'] += reused
+            self.metrics['wait_time'] += waited
+            if waited > self.metrics['max_wait_time']:
+                self.metrics['max_wait_time'] = waited
+
+    def is_expired(self, connection):
+        return (
+            time.monotonic() - self.opened_at.get(connection, 0)
+            > self.max_lifetime
+        )
+
+    def is_usable(self, connection, returned_at):
+        if self.is_expired(connection):
+            self.discard(connection, 'expired')
+            return False
+        if connection.closed:
+            self.discard(connection)
+            return False
+        if time.monotonic() - returned_at < self.check_idle:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except Exception:
+            self.discard(connection, 'health_check_failures')
+            return False
+        return True
+
+    def checkin(self, connection):
+        """Возвращает соединение в пул, закрывая непригодные."""
+        if connection.closed:
+            self.discard(connection)
+            return
+        if self.is_expired(connection):
+            self.discard(connection, 'expired')
+            return
+        if connection.info.transaction_status != TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except Exception:
+                self.discard(connection)
+                return
+        now = time.monotonic()
+        with self.condition:
+            self.idle.append((connection, now))
+            stale = []
+            while (
+                self.idle
+                and self.size - len(stale) > self.min_size
+                and now - self.idle[0][1] > self.max_idle
+            ):
+                stale.append(self.idle.popleft()[0])
+            self.condition.notify()
+        for connection in stale:
+            self.discard(connection)
+
+    def discard(self, connection, reason=None):
+        """Закрывает соединение и освобождает его место в пуле."""
+        try:
+            connection.close()
+        except Exception:
+            logger.warning('Не удалось закрыть соединение пула %s', self.name)
+        with self.condition:
+            self.opened_at.pop(connection, None)
+            self.size -= 1
+            self.metrics['closed'] += 1
+            if reason:
+                self.metrics[reason] += 1
+            self.condition.notify()
+
+    def clear(self):
+        """Закрывает все свободные соединения."""
+        with self.condition:
+            idle = [connection for connection, _ in self.idle]
+            self.idle.clear()
+        for connection in idle:
+            self.discard(connection)
+
+    def stats(self):
+        with self.condition:
+            idle = len(self.idle)
+            return {
+                **self.metrics,
+                'size': self.size,
+                'idle': idle,
+                'in_use': self.size - idle,
+                'waiting': self.waiting,
+                'max_size': self.max_size,
+            }
+
+
+def get_pool(alias, conn_params, options):
+    """
+    Пул для параметров соединения. Пулы, унаследованные от родителя при
+    fork, не используются и не закрываются: их сокеты принадлежат ему.
+    """
+    key = (alias, repr(sorted(conn_params.items())))
+    pool = _pools.get(key)
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.pid != os.getpid():
+            if pool is not None:
+                _inherited.append(pool)
+            pool = _pools[key] = ConnectionPool(
+                name='{}/{}'.format(alias, conn_params.get('dbname', '')),
+                min_size=options.get('MIN_SIZE', 0),
+                max_size=options.get('MAX_SIZE', 10),
+                max_lifetime=options.get('MAX_LIFETIME', 3600),
+                max_idle=options.get('MAX_IDLE', 300),
+                timeout=options.get('TIMEOUT', 10),
+                check_idle=options.get('CHECK_IDLE', 1),
+            )
+        return pool
+
+
+def clear_pools():
+    for pool in list(_pools.values()):
+        if pool.pid == os.getpid():
+            pool.clear()
+
+
+def pool_stats():
+    """Метрики пулов текущего процесса."""
+    return {
+        pool.name: pool.stats()
+        for pool in list(_pools.values())
+        if pool.pid == os.getpid()
+    }
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -76,12 +77,21 @@ WSGI_APPLICATION = 'foodgram_project.wsgi.application'
 if not DEBUG:
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.postgresql',
+            'ENGINE': 'foodgram_project.postgresql_pool',
             'NAME': os.getenv('POSTGRES_DB', 'django'),
             'USER': os.getenv('POSTGRES_USER', 'django'),
             'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
             'HOST': os.getenv('DB_HOST', ''),
-            'PORT': os.getenv('DB_PORT', 5432)
+            'PORT': os.getenv('DB_PORT', 5432),
+            'CONN_MAX_AGE': 0,
+            'POOL': {
+                'MIN_SIZE': int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+                'MAX_SIZE': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+                'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+                'MAX_LIFETIME': float(os.getenv('DB_POOL_MAX_LIFETIME', 3600)),
+                'MAX_IDLE': float(os.getenv('DB_POOL_MAX_IDLE', 300)),
+                'CHECK_IDLE': float(os.getenv('DB_POOL_CHECK_IDLE', 1)),
+            },
         }
     }
 else:
@@ -137,6 +147,24 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = "media/"
 MEDIA_ROOT = BASE_DIR / MEDIA_URL
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'recipe_images': {
+        'BACKEND': os.getenv(
+            'RECIPE_IMAGES_STORAGE',
+            'recipes.storage.ContentAddressedStorage'
+        ),
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+IMAGE_VARIANT_FORMAT = os.getenv('IMAGE_VARIANT_FORMAT', 'WEBP')
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
@@ -149,7 +177,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'api.paginator.ResultsSetPagination',
     'PAGE_SIZE': 6,
@@ -158,6 +186,71 @@ REST_FRAMEWORK = {
     ],
 }
 
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', 300))
+
+IDEMPOTENCY_KEY_TIMEOUT = int(
+    os.getenv('IDEMPOTENCY_KEY_TIMEOUT', 60 * 60 * 24)
+)
+
+INGREDIENT_SEARCH_BACKEND = os.getenv('INGREDIENT_SEARCH_BACKEND', 'memory')
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram_cache')
+        ),
+    },
+    'feed': {
+        'BACKEND': os.getenv(
+            'FEED_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('FEED_CACHE_LOCATION', 'feed'),
+        'TIMEOUT': int(os.getenv('FEED_CACHE_TIMEOUT', 300)),
+    },
+    # Несколько версий справочников и ленты: до MAX_ENTRIES не дорастают,
+    # поэтому никогда не вытесняются.
+    'versions': {
+        'BACKEND': os.getenv(
+            'VERSION_CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'VERSION_CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram_versions')
+        ),
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+    # Владельцы токенов и версии пользователей: по записи на токен и на
+    # пользователя, поэтому размер задаётся явно.
+    'auth': {
+        'BACKEND': os.getenv(
+            'AUTH_CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'AUTH_CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram_auth')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('AUTH_CACHE_MAX_ENTRIES', 50000)),
+        },
+    },
+}
+
+FEED_CACHE = os.getenv('FEED_CACHE', 'feed')
+VERSION_CACHE = os.getenv('VERSION_CACHE', 'versions')
+AUTH_CACHE = os.getenv('AUTH_CACHE', 'auth')
+
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'false').lower() == 'true'
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
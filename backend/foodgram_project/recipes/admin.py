@@ -6,6 +6,7 @@ from .constants import (
     MAX_NUMBER_OF_TAGS_OR_INGREDIENTS_PER_PAGE,
     NUMBER_OF_VISIBLE_CHARACTERS_IN_ADMIN_PANEL,
 )
+from .images import schedule_image_processing
 from .models import (
     Favorite,
     Follow,
@@ -18,6 +19,41 @@ from .models import (
 )
 
 
+class ReadOnlyAdmin(admin.ModelAdmin):
+    """
+    Строки только для просмотра: вместе с ними меняются списки покупок
+    и счётчики, а это делает API, а не админка.
+    """
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class CascadeDeleteMixin:
+    """
+    Удаление объекта вместе со строками read_only_cascades: при каскаде
+    списки покупок и счётчики поправляют сигналы pre_delete, а прямое
+    удаление этих строк в их админках по-прежнему запрещено.
+    """
+
+    read_only_cascades = ()
+
+    def get_deleted_objects(self, objs, request):
+        deleted, model_count, perms_needed, protected = (
+            super().get_deleted_objects(objs, request)
+        )
+        perms_needed -= {
+            str(model._meta.verbose_name) for model in self.read_only_cascades
+        }
+        return deleted, model_count, perms_needed, protected
+
+
 class OnlyWithFollowersOrFollowingsListFilter(admin.SimpleListFilter):
     title = ('Фильтр по наличию подписиков и подписок')
     parameter_name = 'following_count'
@@ -34,45 +70,36 @@ class OnlyWithFollowersOrFollowingsListFilter(admin.SimpleListFilter):
 
         if self.value() == 'нет подписчиков':
             return queryset.filter(
-                follower__count=0,
+                followers_count=0,
             )
         if self.value() == 'нет подписок':
             return queryset.filter(
-                following__count=0,
+                following_count=0,
             )
         if self.value() == 'все':
             return queryset.all()
 
 
 @admin.register(User)
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(CascadeDeleteMixin, admin.ModelAdmin):
     list_display = (
         'id',
         'username',
         'first_name',
         'last_name',
         'recipes_count',
-        'followers',
-        'following',
+        'followers_count',
+        'following_count',
     )
     list_filter = [OnlyWithFollowersOrFollowingsListFilter]
     empty_value_display = '-empty-'
-
-    @admin.display(empty_value=None)
-    def recipes_count(self, user):
-        return user.recipes.count()
-
-    @admin.display(description='Подписчики', empty_value=None)
-    def followers(self, user):
-        return user.followers.count()
-
-    @admin.display(description='Подписки', empty_value=None)
-    def following(self, user):
-        return user.authors.count()
+    read_only_cascades = (
+        RecipeIngredient, ShoppingCart, Favorite, Follow
+    )
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(CascadeDeleteMixin, admin.ModelAdmin):
     list_display = (
         'id',
         'name',
@@ -81,6 +108,7 @@ class IngredientAdmin(admin.ModelAdmin):
     )
     list_filter = ('measurement_unit',)
     empty_value_display = '-empty-'
+    read_only_cascades = (RecipeIngredient,)
 
     @admin.display(empty_value=None)
     def recipes_count(self, ingredient):
@@ -114,12 +142,12 @@ class CookingTimeListFilter(admin.SimpleListFilter):
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(CascadeDeleteMixin, admin.ModelAdmin):
     list_display = (
         'id',
         'name',
         'author',
-        'in_favorite_count',
+        'favorites_count',
         'cooking_time',
         'display_image',
         'display_tags',
@@ -128,6 +156,14 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = [CookingTimeListFilter]
     empty_value_display = '-empty-'
     readonly_fields = ['preview']
+    read_only_cascades = (RecipeIngredient, ShoppingCart, Favorite)
+
+    def save_model(self, request, recipe, form, change):
+        if 'image' in form.changed_data:
+            recipe.image_processed = False
+        super().save_model(request, recipe, form, change)
+        if not recipe.image_processed:
+            schedule_image_processing(recipe.id)
 
     def preview(self, recipe):
         return mark_safe(
@@ -135,10 +171,6 @@ class RecipeAdmin(admin.ModelAdmin):
             f'src="{recipe.image.url}">'
         )
 
-    @admin.display(description='Подписчики', empty_value=None)
-    def in_favorite_count(self, recipe):
-        return recipe.favorite.count()
-
     @admin.display(description='Фотография', empty_value=None)
     def display_image(self, recipe):
         return mark_safe(
@@ -194,7 +226,7 @@ class TagAdmin(admin.ModelAdmin):
 
 
 @admin.register(RecipeIngredient)
-class RecipeIngredientAdmin(admin.ModelAdmin):
+class RecipeIngredientAdmin(ReadOnlyAdmin):
     list_display = (
         'id',
         'recipe',
@@ -204,7 +236,7 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(ReadOnlyAdmin):
     list_display = (
         'id',
         'user',
@@ -214,7 +246,7 @@ class ShoppingCartAdmin(admin.ModelAdmin):
 
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(ReadOnlyAdmin):
     list_display = (
         'id',
         'user',
@@ -224,7 +256,7 @@ class FollowAdmin(admin.ModelAdmin):
 
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(ReadOnlyAdmin):
     list_display = (
         'id',
         'user',
@@ -0,0 +1,72 @@
+"""
+Добавление и удаление пачек строк избранного, корзины и подписок одним
+запросом. RETURNING сообщает, какие строки действительно вставлены или
+удалены, поэтому счётчики и списки покупок меняются ровно на них, даже
+если те же строки параллельно меняет другой запрос.
+"""
+from django.db import connection
+
+from .models import Follow, Recipe, User
+
+INSERT_SQL = '''
+    INSERT INTO {table} (user_id, {target})
+    SELECT %s, id FROM {source} WHERE id IN ({ids}){exclude} ORDER BY id
+    ON CONFLICT (user_id, {target}) DO NOTHING
+    RETURNING {target}
+'''
+DELETE_SQL = '''
+    DELETE FROM {table} WHERE user_id = %s{where} RETURNING {target}
+'''
+
+
+def placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def returned_ids(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def bulk_insert(model, target, source, user_id, ids, exclude_user=False):
+    """Вставляет отсутствующие строки и возвращает id вставленных целей."""
+    return returned_ids(
+        INSERT_SQL.format(
+            table=model._meta.db_table,
+            target=target,
+            source=source._meta.db_table,
+            ids=placeholders(ids),
+            exclude=' AND id <> %s' if exclude_user else '',
+        ),
+        [user_id, *ids, *([user_id] if exclude_user else [])],
+    )
+
+
+def bulk_delete(model, target, user_id, ids=None):
+    """Удаляет строки пользователя (все при ids=None), возвращает их цели."""
+    where = '' if ids is None else f' AND {target} IN ({placeholders(ids)})'
+    return returned_ids(
+        DELETE_SQL.format(
+            table=model._meta.db_table, target=target, where=where
+        ),
+        [user_id, *(ids or [])],
+    )
+
+
+def add_user_recipes(model, user_id, recipe_ids):
+    return bulk_insert(model, 'recipe_id', Recipe, user_id, recipe_ids)
+
+
+def remove_user_recipes(model, user_id, recipe_ids=None):
+    return bulk_delete(model, 'recipe_id', user_id, recipe_ids)
+
+
+def add_follows(user_id, author_ids):
+    return bulk_insert(
+        Follow, 'following_id', User, user_id, author_ids, exclude_user=True
+    )
+
+
+def remove_follows(user_id, author_ids):
+    return bulk_delete(Follow, 'following_id', user_id, author_ids)
@@ -14,6 +14,8 @@ MAX_NUMBER_OF_TAGS_OR_INGREDIENTS_PER_PAGE = 15
 NAME_MAX_LENGHT = 200
 NUMBER_OF_VISIBLE_CHARACTERS_IN_ADMIN_PANEL = 50
 
+SEARCH_CONFIG = 'russian'
+
 SLUG_MAX_LENGHT = 200
 
 USERNAME_MAX_LENGHT = 150
@@ -0,0 +1,105 @@
+import itertools
+
+from django.db import transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, When
+from django.db.models.functions import Coalesce
+
+from .models import Favorite, Follow, Recipe, ShoppingCart, User
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'cart_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'following'),
+    (User, 'following_count', Follow, 'user'),
+)
+
+
+def counter_delta(field, delta):
+    return F(field) + delta
+
+
+def actual_count(source, source_field):
+    """Число строк source, ссылающихся на строку внешнего запроса."""
+    return Coalesce(Subquery(
+        source.objects.filter(
+            **{source_field: OuterRef('pk')}
+        ).order_by().values(source_field).annotate(
+            count=Count('pk')
+        ).values('count')
+    ), 0)
+
+
+def update_follow_counters(user_id, following_ids, delta):
+    """
+    Счётчики подписок подписчика и подписчиков авторов following_ids
+    одним UPDATE.
+    """
+    User.objects.filter(id__in=(user_id, *following_ids)).update(
+        following_count=Case(
+            When(
+                id=user_id,
+                then=counter_delta(
+                    'following_count', delta * len(following_ids)
+                ),
+            ),
+            default=F('following_count'),
+        ),
+        followers_count=Case(
+            When(
+                id__in=following_ids,
+                then=counter_delta('followers_count', delta),
+            ),
+            default=F('followers_count'),
+        ),
+    )
+
+
+def forget_user(user):
+    """
+    Избранное, корзина и подписки пользователя удаляются каскадно, без
+    сигналов, поэтому счётчики рецептов и других пользователей
+    уменьшаются заранее.
+    """
+    Recipe.objects.filter(favorite__user=user).update(
+        favorites_count=counter_delta('favorites_count', -1)
+    )
+    Recipe.objects.filter(shoppingcart__user=user).update(
+        cart_count=counter_delta('cart_count', -1)
+    )
+    User.objects.filter(authors__user=user).update(
+        followers_count=counter_delta('followers_count', -1)
+    )
+    User.objects.filter(followers__following=user).update(
+        following_count=counter_delta('following_count', -1)
+    )
+
+
+def reconcile_counters(model, ids):
+    """
+    Пересчитывает разошедшиеся счётчики строк ids и возвращает их число.
+    Строки блокируются до пересчёта, поэтому параллельные F()-обновления
+    дождутся его и лягут поверх.
+    """
+    reconciled = 0
+    with transaction.atomic():
+        list(model.objects.select_for_update().filter(
+            id__in=ids
+        ).values_list('id', flat=True))
+        for counter_model, field, source, source_field in COUNTERS:
+            if counter_model is not model:
+                continue
+            count = actual_count(source, source_field)
+            reconciled += model.objects.filter(id__in=ids).exclude(
+                **{field: count}
+            ).update(**{field: count})
+    return reconciled
+
+
+def reconcile_in_batches(model, ids, batch_size):
+    """reconcile_counters по пачкам: блокировки держатся недолго."""
+    ids = iter(ids)
+    reconciled = 0
+    while batch := list(itertools.islice(ids, batch_size)):
+        reconciled += reconcile_counters(model, batch)
+    return reconciled
@@ -0,0 +1,131 @@
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connection, transaction
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+# Отправляется с recipe_id, когда варианты фото рецепта готовы.
+image_processed = Signal()
+
+VARIANTS_DIRECTORY = 'variants'
+IMAGE_VARIANTS = {
+    'thumbnail': (160, 160),
+    'card': (480, 480),
+    'full': (1280, 1280),
+}
+IMAGE_FORMATS = {
+    'WEBP': ('webp', {'quality': 80, 'method': 4}),
+    'JPEG': ('jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_name(image_name, variant):
+    extension, _ = IMAGE_FORMATS[settings.IMAGE_VARIANT_FORMAT]
+    return '{}/{}/{}.{}'.format(
+        VARIANTS_DIRECTORY, PurePosixPath(image_name).stem, variant, extension
+    )
+
+
+def image_url(recipe, variant):
+    """Адрес варианта, пока он не готов — адрес исходного файла."""
+    if not recipe.image:
+        return None
+    if not recipe.image_processed:
+        return recipe.image.url
+    return default_storage.url(variant_name(recipe.image.name, variant))
+
+
+def render_variant(image, size):
+    """
+    Уменьшенная копия без метаданных: EXIF не переносится, ориентация
+    уже применена к пикселям.
+    """
+    variant = image.copy()
+    variant.thumbnail(size, Image.LANCZOS)
+    image_format = settings.IMAGE_VARIANT_FORMAT
+    _, options = IMAGE_FORMATS[image_format]
+    if image_format == 'JPEG' and variant.mode != 'RGB':
+        variant = variant.convert('RGB')
+    buffer = io.BytesIO()
+    variant.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def process_recipe_image(recipe_id):
+    """
+    Готовит варианты фото рецепта и отмечает рецепт обработанным, если
+    фото не сменилось за время обработки. Возвращает True при успехе.
+    Варианты одинаковых фото совпадают, поэтому готовые не пересоздаются.
+    """
+    recipe = Recipe.objects.filter(id=recipe_id).only('image').first()
+    if recipe is None or not recipe.image:
+        return False
+    names = {
+        variant: variant_name(recipe.image.name, variant)
+        for variant in IMAGE_VARIANTS
+    }
+    if not all(default_storage.exists(name) for name in names.values()):
+        with recipe.image.open('rb') as file:
+            image = ImageOps.exif_transpose(Image.open(file))
+            image.load()
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert(
+                'RGBA' if 'A' in image.getbands() else 'RGB'
+            )
+        for variant, size in IMAGE_VARIANTS.items():
+            default_storage.delete(names[variant])
+            default_storage.save(
+                names[variant], ContentFile(render_variant(image, size))
+            )
+    if not Recipe.objects.filter(
+        id=recipe_id, image=recipe.image.name
+    ).touch(image_processed=True):
+        return False
+    image_processed.send(sender=Recipe, recipe_id=recipe_id)
+    return True
+
+
+def run_image_task(recipe_id):
+    close_old_connections()
+    try:
+        process_recipe_image(recipe_id)
+    except Exception:
+        logger.exception('Не удалось обработать фото рецепта %s', recipe_id)
+    finally:
+        connection.close()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS,
+                thread_name_prefix='recipe-images',
+            )
+        return _executor
+
+
+def schedule_image_processing(recipe_id):
+    """
+    Ставит обработку фото в очередь после фиксации транзакции. При
+    IMAGE_WORKERS = 0 фото обрабатывает команда process_images.
+    """
+    if settings.IMAGE_WORKERS:
+        transaction.on_commit(
+            lambda: get_executor().submit(run_image_task, recipe_id)
+        )
@@ -0,0 +1,89 @@
+import os
+import posixpath
+from datetime import timedelta
+from pathlib import PurePosixPath
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.images import VARIANTS_DIRECTORY
+from recipes.models import Recipe
+from recipes.storage import recipe_image_storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет фото и их варианты, на которые не ссылается ни один рецепт. '
+        'Каталоги обходятся по одному, свежие файлы не трогаются: их '
+        'рецепт может быть ещё не сохранён.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours', type=float, default=24,
+            help='Не удалять файлы моложе этого возраста.'
+        )
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        stems = {
+            PurePosixPath(name).stem
+            for name in Recipe.objects.exclude(image='').values_list(
+                'image', flat=True
+            ).iterator()
+        }
+        self.threshold = timezone.now() - timedelta(
+            hours=options['grace_hours']
+        )
+        self.dry_run = options['dry_run']
+        for storage, directory, stem_of in (
+            (
+                recipe_image_storage(),
+                Recipe._meta.get_field('image').upload_to.strip('/'),
+                lambda name: PurePosixPath(name).stem,
+            ),
+            (
+                default_storage,
+                VARIANTS_DIRECTORY,
+                lambda name: PurePosixPath(name).parent.name,
+            ),
+        ):
+            removed = sum(
+                self.remove(storage, name)
+                for name in self.walk(storage, directory)
+                if stem_of(name) not in stems
+            )
+            self.stdout.write(
+                '{}: {} {}.'.format(
+                    directory,
+                    'к удалению' if self.dry_run else 'удалено',
+                    removed,
+                )
+            )
+
+    def walk(self, storage, directory):
+        if not storage.exists(directory):
+            return
+        directories, files = storage.listdir(directory)
+        for name in files:
+            yield posixpath.join(directory, name)
+        for name in directories:
+            subdirectory = posixpath.join(directory, name)
+            yield from self.walk(storage, subdirectory)
+            self.remove_empty_directory(storage, subdirectory)
+
+    def remove_empty_directory(self, storage, directory):
+        if self.dry_run:
+            return
+        try:
+            os.rmdir(storage.path(directory))
+        except (NotImplementedError, OSError):
+            pass
+
+    def remove(self, storage, name):
+        if storage.get_modified_time(name) > self.threshold:
+            return False
+        if not self.dry_run:
+            storage.delete(name)
+        return True
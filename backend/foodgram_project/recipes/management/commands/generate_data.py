@@ -0,0 +1,302 @@
+import csv
+import io
+import itertools
+import json
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from api.catalog import bump_catalog_version
+from recipes.counters import reconcile_in_batches
+from recipes.models import (
+    Favorite,
+    Follow,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Tag,
+    User,
+)
+from recipes.search import update_search_index
+from recipes.shopping_list import rebuild_shopping_lists
+
+GENERATED_IMAGE = 'images/generated.png'
+GENERATED_PASSWORD = 'generated-password'
+MIN_INGREDIENTS = 5
+MAX_INGREDIENTS = 20
+PUBLICATION_PERIOD = timedelta(days=365)
+
+
+@contextmanager
+def explicit_pub_date():
+    """Позволяет задать pub_date вместо текущего времени (auto_now_add)."""
+    field = Recipe._meta.get_field('pub_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Sampler:
+    """Выбор объектов со степенным (Zipf) распределением популярности."""
+
+    def __init__(self, rng, population, alpha):
+        self.rng = rng
+        self.population = list(population)
+        rng.shuffle(self.population)
+        self.cum_weights = list(itertools.accumulate(
+            1 / rank ** alpha for rank in range(1, len(self.population) + 1)
+        ))
+
+    def choices(self, count):
+        return self.rng.choices(
+            self.population, cum_weights=self.cum_weights, k=count
+        )
+
+    def distinct(self, count, exclude=None):
+        count = min(count, len(self.population) - (exclude is not None))
+        result = set()
+        for _ in range(10):
+            result.update(self.choices(count - len(result)))
+            result.discard(exclude)
+            if len(result) >= count:
+                break
+        return result
+
+
+class RowWriter:
+    """Пишет строки пачками через bulk_create или COPY (PostgreSQL)."""
+
+    def __init__(self, batch_size, use_copy):
+        self.batch_size = batch_size
+        self.use_copy = use_copy and connection.vendor == 'postgresql'
+
+    def write(self, model, fields, rows):
+        total = 0
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, self.batch_size))
+            if not batch:
+                return total
+            with transaction.atomic():
+                if self.use_copy:
+                    self.copy(model, fields, batch)
+                else:
+                    model.objects.bulk_create(
+                        model(**dict(zip(fields, row))) for row in batch
+                    )
+            total += len(batch)
+
+    def copy(self, model, fields, batch):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(batch)
+        buffer.seek(0)
+        columns = ', '.join(
+            model._meta.get_field(field).column for field in fields
+        )
+        with connection.cursor() as cursor:
+            cursor.cursor.copy_expert(
+                f'COPY {model._meta.db_table} ({columns}) '
+                'FROM STDIN WITH (FORMAT csv)',
+                buffer,
+            )
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерирует синтетические рецепты, продукты рецептов, избранное, '
+        'корзины и подписки для нагрузочного тестирования.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int, default=100_000,
+            help='Целевое число рецептов; остальные объёмы считаются от него.'
+        )
+        parser.add_argument('--users', type=int)
+        parser.add_argument('--favorites', type=int)
+        parser.add_argument('--carts', type=int)
+        parser.add_argument('--follows', type=int)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument(
+            '--alpha', type=float, default=1.1,
+            help='Показатель степенного распределения популярности.'
+        )
+        parser.add_argument(
+            '--copy', action='store_true',
+            help='Писать связи через COPY (только PostgreSQL).'
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        recipes_total = options['recipes']
+        users_total = options['users'] or max(recipes_total // 5, 2)
+        favorites_total = options['favorites'] or recipes_total * 10
+        carts_total = options['carts'] or recipes_total * 2
+        follows_total = options['follows'] or users_total * 10
+        writer = RowWriter(options['batch_size'], options['copy'])
+
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        if len(ingredient_ids) < MAX_INGREDIENTS:
+            raise CommandError(
+                'Сначала загрузите каталог продуктов: '
+                'python manage.py load_catalog'
+            )
+        tag_ids = self.load_tags()
+
+        started = time.perf_counter()
+        user_ids = self.create_users(users_total, options['batch_size'])
+        self.report('Пользователи', len(user_ids), started)
+
+        started = time.perf_counter()
+        authors = Sampler(rng, user_ids, options['alpha'])
+        recipe_ids, ingredients_count = self.create_recipes(
+            rng, recipes_total, authors, tag_ids, ingredient_ids, writer,
+            options['batch_size'],
+        )
+        self.report('Рецепты', len(recipe_ids), started)
+        self.report('Продукты в рецептах', ingredients_count, started)
+
+        started = time.perf_counter()
+        update_search_index(recipe_ids)
+        self.report('Поисковый индекс', len(recipe_ids), started)
+
+        recipes = Sampler(rng, recipe_ids, options['alpha'])
+        for model, total, sampler, field in (
+            (Favorite, favorites_total, recipes, 'recipe_id'),
+            (ShoppingCart, carts_total, recipes, 'recipe_id'),
+            (Follow, follows_total, authors, 'following_id'),
+        ):
+            started = time.perf_counter()
+            count = writer.write(
+                model,
+                ('user_id', field),
+                self.user_links(rng, user_ids, total, sampler, model),
+            )
+            self.report(model._meta.verbose_name_plural, count, started)
+
+        started = time.perf_counter()
+        for offset in range(0, len(user_ids), options['batch_size']):
+            rebuild_shopping_lists(
+                user_ids[offset:offset + options['batch_size']]
+            )
+        self.report('Списки покупок', len(user_ids), started)
+
+        started = time.perf_counter()
+        for model, ids in ((Recipe, recipe_ids), (User, user_ids)):
+            reconcile_in_batches(model, ids, options['batch_size'])
+        self.report('Счётчики', len(recipe_ids) + len(user_ids), started)
+
+    def report(self, name, count, started):
+        self.stdout.write('{}: {} за {:.1f} с.'.format(
+            name, count, time.perf_counter() - started
+        ))
+
+    def load_tags(self):
+        with open(
+            settings.BASE_DIR / 'data' / 'tags.json', encoding='utf-8'
+        ) as file:
+            tags = [row['fields'] for row in json.load(file)]
+        Tag.objects.bulk_create(
+            (Tag(**fields) for fields in tags), ignore_conflicts=True
+        )
+        bump_catalog_version()
+        return list(Tag.objects.filter(
+            slug__in=[fields['slug'] for fields in tags]
+        ).values_list('id', flat=True))
+
+    def create_users(self, total, batch_size):
+        start = (User.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+        password = make_password(GENERATED_PASSWORD)
+        user_ids = []
+        for offset in range(0, total, batch_size):
+            with transaction.atomic():
+                user_ids += [user.id for user in User.objects.bulk_create(
+                    User(
+                        username=f'generated{number}',
+                        email=f'generated{number}@example.com',
+                        first_name='Имя',
+                        last_name='Фамилия',
+                        password=password,
+                    )
+                    for number in range(
+                        start + offset,
+                        start + min(offset + batch_size, total)
+                    )
+                )]
+        return user_ids
+
+    def create_recipes(
+        self, rng, total, authors, tag_ids, ingredient_ids, writer,
+        batch_size,
+    ):
+        now = timezone.now()
+        period = PUBLICATION_PERIOD.total_seconds()
+        recipe_ids = []
+        ingredients_count = 0
+        for offset in range(0, total, batch_size):
+            size = min(batch_size, total - offset)
+            with explicit_pub_date(), transaction.atomic():
+                batch = [recipe.id for recipe in Recipe.objects.bulk_create(
+                    Recipe(
+                        name=f'Рецепт {offset + number}',
+                        text='Описание рецепта',
+                        cooking_time=rng.randint(1, 180),
+                        author_id=author_id,
+                        image=GENERATED_IMAGE,
+                        pub_date=now - timedelta(
+                            seconds=rng.random() * period
+                        ),
+                    )
+                    for number, author_id in enumerate(authors.choices(size))
+                )]
+            recipe_ids += batch
+            writer.write(
+                Recipe.tags.through,
+                ('recipe_id', 'tag_id'),
+                (
+                    (recipe_id, tag_id)
+                    for recipe_id in batch
+                    for tag_id in rng.sample(
+                        tag_ids, rng.randint(1, len(tag_ids))
+                    )
+                ),
+            )
+            ingredients_count += writer.write(
+                RecipeIngredient,
+                ('recipe_id', 'ingredient_id', 'amount'),
+                (
+                    (recipe_id, ingredient_id, rng.randint(1, 500))
+                    for recipe_id in batch
+                    for ingredient_id in rng.sample(
+                        ingredient_ids,
+                        rng.randint(MIN_INGREDIENTS, MAX_INGREDIENTS)
+                    )
+                ),
+            )
+        return recipe_ids, ingredients_count
+
+    def user_links(self, rng, user_ids, total, sampler, model):
+        """
+        Пары (пользователь, объект) без повторов: активность пользователей
+        распределена по Парето, объекты выбираются по популярности.
+        """
+        activity = [rng.paretovariate(1.5) for _ in user_ids]
+        scale = total / sum(activity)
+        for user_id, weight in zip(user_ids, activity):
+            exclude = user_id if model is Follow else None
+            for linked_id in sampler.distinct(
+                max(1, round(weight * scale)), exclude
+            ):
+                yield user_id, linked_id
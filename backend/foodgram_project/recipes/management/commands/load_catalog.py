@@ -0,0 +1,127 @@
+import csv
+import itertools
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.catalog import bump_catalog_version
+from recipes.models import Ingredient, Recipe, Tag
+
+DATA_DIR = settings.BASE_DIR / 'data'
+TAG_FIELDS = ('name', 'color')
+
+
+def read_rows(path, fields):
+    """
+    Построчно читает CSV без заголовка или JSON (фикстура Django
+    либо список словарей) и возвращает кортежи значений полей.
+    """
+    path = Path(path)
+    if not path.exists():
+        raise CommandError(f'Файл {path} не найден.')
+    with open(path, encoding='utf-8') as file:
+        if path.suffix == '.csv':
+            for row in csv.reader(file):
+                if row:
+                    yield tuple(value.strip() for value in row[:len(fields)])
+            return
+        for row in json.load(file):
+            row = row.get('fields', row)
+            yield tuple(str(row[field]).strip() for field in fields)
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает каталог продуктов и тегов из файлов data/. Повторный '
+        'запуск ничего не меняет, если файлы не изменились.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ingredients', default=DATA_DIR / 'ingredients.csv',
+            help='CSV (название,мера) или JSON с продуктами.'
+        )
+        parser.add_argument(
+            '--tags', default=DATA_DIR / 'tags.json',
+            help='JSON с тегами.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            ingredients = self.load_ingredients(
+                options['ingredients'], options['batch_size']
+            )
+            tags = self.load_tags(options['tags'], options['batch_size'])
+            self.report('Продукты', ingredients)
+            self.report('Теги', tags)
+            if any(
+                inserted or updated
+                for inserted, updated, _ in (ingredients, tags)
+            ):
+                bump_catalog_version()
+
+    def report(self, name, counts):
+        self.stdout.write(
+            '{}: добавлено {}, обновлено {}, пропущено {}.'.format(
+                name, *counts
+            )
+        )
+
+    def load_ingredients(self, path, batch_size):
+        existing = set(
+            Ingredient.objects.values_list('name', 'measurement_unit')
+        )
+        # ignore_conflicts молча пропускает строки, вставленные параллельно,
+        # поэтому добавленные считаются по числу строк в таблице.
+        count_before = Ingredient.objects.count()
+        total = 0
+        rows = read_rows(path, ('name', 'measurement_unit'))
+        while batch := list(itertools.islice(rows, batch_size)):
+            total += len(batch)
+            new = []
+            for row in batch:
+                if row in existing:
+                    continue
+                existing.add(row)
+                new.append(
+                    Ingredient(name=row[0], measurement_unit=row[1])
+                )
+            Ingredient.objects.bulk_create(new, ignore_conflicts=True)
+        inserted = Ingredient.objects.count() - count_before
+        return inserted, 0, total - inserted
+
+    def load_tags(self, path, batch_size):
+        existing = {
+            slug: values for slug, *values in
+            Tag.objects.values_list('slug', *TAG_FIELDS)
+        }
+        inserted = skipped = 0
+        updated_slugs = []
+        rows = read_rows(path, ('slug', *TAG_FIELDS))
+        while batch := list(itertools.islice(rows, batch_size)):
+            changed = []
+            for slug, *values in batch:
+                if existing.get(slug) == values:
+                    skipped += 1
+                    continue
+                if slug in existing:
+                    updated_slugs.append(slug)
+                else:
+                    inserted += 1
+                existing[slug] = values
+                changed.append(Tag(slug=slug, **dict(zip(TAG_FIELDS, values))))
+            Tag.objects.bulk_create(
+                changed,
+                update_conflicts=True,
+                unique_fields=['slug'],
+                update_fields=TAG_FIELDS,
+            )
+        # bulk_create не отправляет post_save, поэтому рецепты с
+        # изменёнными тегами обновляются здесь, как в сигнале tag_changed.
+        if updated_slugs:
+            Recipe.objects.filter(tags__slug__in=updated_slugs).touch()
+        return inserted, len(updated_slugs), skipped
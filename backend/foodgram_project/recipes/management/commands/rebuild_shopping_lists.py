@@ -0,0 +1,31 @@
+import itertools
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import User
+from recipes.shopping_list import rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает списки покупок пользователей по их корзинам; '
+        'нужна после загрузки данных в обход API или для исправления '
+        'расхождений.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', nargs='*', type=int,
+            help='id пользователей; по умолчанию все.'
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        user_ids = iter(options['users'] or User.objects.order_by(
+            'id'
+        ).values_list('id', flat=True))
+        total = 0
+        while batch := list(itertools.islice(user_ids, options['batch_size'])):
+            rebuild_shopping_lists(batch)
+            total += len(batch)
+        self.stdout.write(f'Списки покупок пересчитаны: {total}.')
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from recipes.counters import reconcile_in_batches
+from recipes.models import Recipe, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики рецептов и пользователей (избранное, '
+        'корзины, рецепты, подписки), разошедшиеся с данными; нужна после '
+        'загрузки данных в обход API.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        for model in (Recipe, User):
+            reconciled = reconcile_in_batches(
+                model,
+                model.objects.order_by('id').values_list('id', flat=True),
+                options['batch_size'],
+            )
+            self.stdout.write('{}: исправлено счётчиков {}.'.format(
+                model._meta.verbose_name_plural, reconciled
+            ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from recipes.search import update_search_index
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает данные полнотекстового поиска по всем рецептам.'
+
+    def handle(self, *args, **options):
+        update_search_index()
+        self.stdout.write('Поисковый индекс рецептов пересчитан.')
@@ -0,0 +1,31 @@
+# Generated by Django 4.2 on 2026-10-18 04:09
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+import recipes.search
+
+
+def build_search_index(apps, schema_editor):
+    recipes.search.create_search_index(schema_editor)
+    recipes.search.update_search_index(using=schema_editor.connection)
+
+
+def remove_search_index(apps, schema_editor):
+    recipes.search.drop_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_ingredient_name_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(build_search_index, remove_search_index),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2 on 2026-10-18 04:40
+
+from django.db import migrations, models
+
+TAGS_INDEX_NAME = 'recipes_recipe_tags_tag_recipe_idx'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['recipe', 'user'], name='favorite_recipe_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['updated_at'], name='recipe_updated_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppingcart',
+            index=models.Index(fields=['recipe', 'user'], name='shoppingcart_recipe_user_idx'),
+        ),
+        migrations.RunSQL(
+            f'CREATE INDEX {TAGS_INDEX_NAME} '
+            'ON recipes_recipe_tags (tag_id, recipe_id)',
+            f'DROP INDEX {TAGS_INDEX_NAME}',
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2 on 2026-10-18 04:45
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_recipe_image_processed'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(default=None, storage=recipes.storage.recipe_image_storage, upload_to='images/', verbose_name='Фото рецепта'),
+        ),
+    ]
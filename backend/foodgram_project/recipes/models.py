@@ -1,9 +1,19 @@
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import (
     MinValueValidator,
 )
 from django.db import models
-from django.db.models import UniqueConstraint
+from django.db.models import (
+    Exists,
+    F,
+    OuterRef,
+    Prefetch,
+    UniqueConstraint,
+    Window,
+)
+from django.db.models.functions import RowNumber
+from django.utils import timezone
 
 from .color_generator import color_generator
 from .constants import (
@@ -17,6 +27,7 @@ from .constants import (
     SLUG_MAX_LENGHT,
     USERNAME_MAX_LENGHT,
 )
+from .storage import recipe_image_storage
 from .validators import (
     isValidHexaCode,
     validate_found_special_symbols,
@@ -46,6 +57,15 @@ class User(AbstractUser):
         max_length=EMAIL_MAX_LENGHT,
         unique=True,
     )
+    recipes_count = models.IntegerField(
+        'Число рецептов', default=0, editable=False,
+    )
+    followers_count = models.IntegerField(
+        'Число подписчиков', default=0, editable=False,
+    )
+    following_count = models.IntegerField(
+        'Число подписок', default=0, editable=False,
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
@@ -102,6 +122,12 @@ class Ingredient(models.Model):
     )
 
     class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient',
+            ),
+        ]
         verbose_name = 'Продукт'
         verbose_name_plural = 'Продукты'
         ordering = ('name',)
@@ -110,6 +136,49 @@ class Ingredient(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def with_related(self):
+        """
+        Подгружает автора, теги и продукты рецептов фиксированным числом
+        запросов независимо от размера выборки.
+        """
+        return self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient'),
+            ),
+        )
+
+    def with_user_flags(self, user):
+        """
+        Аннотирует рецепты флагами is_favorited и is_in_shopping_cart
+        для пользователя одним запросом на всю выборку.
+        """
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=models.Value(False),
+                is_in_shopping_cart=models.Value(False),
+            )
+        return self.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+        )
+
+    def touch(self, **fields):
+        """
+        Обновляет updated_at, когда меняется представление рецептов
+        без сохранения самих рецептов. В том же UPDATE можно изменить
+        и другие поля, например счётчики.
+        """
+        return self.update(updated_at=timezone.now(), **fields)
+
+
 class Recipe(models.Model):
     """Модель таблицы Рецепты."""
 
@@ -126,8 +195,12 @@ class Recipe(models.Model):
     image = models.ImageField(
         'Фото рецепта',
         upload_to='images/',
+        storage=recipe_image_storage,
         default=None,
     )
+    image_processed = models.BooleanField(
+        'Варианты фото готовы', default=False, editable=False,
+    )
     name = models.CharField(
         'Заголовок',
         max_length=NAME_MAX_LENGHT,
@@ -151,11 +224,38 @@ class Recipe(models.Model):
         'Дата публикации',
         auto_now_add=True,
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+    )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False,
+    )
+    favorites_count = models.IntegerField(
+        'В избранном', default=0, editable=False,
+    )
+    cart_count = models.IntegerField(
+        'В корзинах', default=0, editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=('-pub_date', '-id'), name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_idx',
+            ),
+            models.Index(fields=('updated_at',), name='recipe_updated_at_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -193,6 +293,33 @@ class RecipeIngredient(models.Model):
         return f'{self.ingredient} {self.recipe} {self.amount}'
 
 
+class FollowQuerySet(models.QuerySet):
+
+    def with_recipes(self, recipes_limit=None):
+        """
+        Добавляет к подпискам автора и его последние рецепты (не более
+        recipes_limit на автора) в атрибуте latest_recipes. Рецепты всех
+        авторов выбираются одним запросом с нумерацией ROW_NUMBER внутри
+        автора.
+        """
+        recipes = Recipe.objects.all()
+        if recipes_limit is not None:
+            recipes = recipes.annotate(
+                row_number=Window(
+                    expression=RowNumber(),
+                    partition_by=F('author'),
+                    order_by=(F('pub_date').desc(), F('id').desc()),
+                )
+            ).filter(row_number__lte=recipes_limit)
+        return self.select_related('following').prefetch_related(
+            Prefetch(
+                'following__recipes',
+                queryset=recipes,
+                to_attr='latest_recipes',
+            )
+        )
+
+
 class Follow(models.Model):
     """
     Модель для связи между автором и подписчиком.
@@ -211,6 +338,8 @@ class Follow(models.Model):
         verbose_name='Автор',
     )
 
+    objects = FollowQuerySet.as_manager()
+
     class Meta:
         constraints = [
             UniqueConstraint(
@@ -243,6 +372,11 @@ class UserRecipeModel(models.Model):
             ),
         ]
         default_related_name = '%(class)s'
+        indexes = [
+            models.Index(
+                fields=('recipe', 'user'), name='%(class)s_recipe_user_idx'
+            ),
+        ]
         ordering = ('user__username',)
 
     def __str__(self):
@@ -261,3 +395,38 @@ class ShoppingCart(UserRecipeModel):
     class Meta(UserRecipeModel.Meta):
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Списки покупок'
+
+
+class ShoppingListItem(models.Model):
+    """
+    Сумма продукта в списке покупок пользователя. Поддерживается при
+    изменении корзины и продуктов рецептов, чтобы выгрузка списка не
+    агрегировала корзину заново.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Продукт',
+    )
+    total_amount = models.IntegerField('Количество')
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item',
+            ),
+        ]
+        verbose_name = 'Продукт в списке покупок'
+        verbose_name_plural = 'Продукты в списках покупок'
+        ordering = ('ingredient__name',)
+
+    def __str__(self):
+        return f'{self.user} {self.ingredient} {self.total_amount}'
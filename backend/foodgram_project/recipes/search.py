@@ -0,0 +1,122 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F
+
+from .constants import SEARCH_CONFIG
+
+FTS_TABLE = 'recipes_recipe_fts'
+
+INGREDIENT_NAMES_SQL = '''
+    SELECT {aggregate}
+    FROM recipes_recipeingredient AS recipe_ingredient
+    JOIN recipes_ingredient AS ingredient
+        ON ingredient.id = recipe_ingredient.ingredient_id
+    WHERE recipe_ingredient.recipe_id = recipes_recipe.id
+'''
+
+POSTGRESQL_UPDATE_SQL = '''
+    UPDATE recipes_recipe SET search_vector =
+        setweight(to_tsvector(%s::regconfig, name), 'A')
+        || setweight(to_tsvector(%s::regconfig, coalesce(({names}), '')), 'B')
+        || setweight(to_tsvector(%s::regconfig, text), 'C')
+'''.format(names=INGREDIENT_NAMES_SQL.format(
+    aggregate="string_agg(ingredient.name, ' ')"
+))
+
+SQLITE_INSERT_SQL = '''
+    INSERT INTO {table} (rowid, name, text, ingredients)
+    SELECT id, name, text, coalesce(({names}), '') FROM recipes_recipe
+'''.format(table=FTS_TABLE, names=INGREDIENT_NAMES_SQL.format(
+    aggregate="group_concat(ingredient.name, ' ')"
+))
+
+
+def create_search_index(schema_editor):
+    """Создаёт индекс полнотекстового поиска для текущей СУБД."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS recipes_recipe_search_vector_gin '
+            'ON recipes_recipe USING gin (search_vector)'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+            'USING fts5(name, text, ingredients)'
+        )
+
+
+def drop_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS recipes_recipe_search_vector_gin'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def update_search_index(recipe_ids=None, using=connection):
+    """
+    Пересчитывает поисковые данные рецептов по названию, описанию и
+    названиям продуктов. Без recipe_ids пересчитываются все рецепты.
+    """
+    ids, params = '', []
+    if recipe_ids is not None:
+        params = list(recipe_ids)
+        if not params:
+            return
+        ids = ' IN ({})'.format(', '.join(['%s'] * len(params)))
+    with using.cursor() as cursor:
+        if using.vendor == 'postgresql':
+            cursor.execute(
+                POSTGRESQL_UPDATE_SQL + (ids and ' WHERE id' + ids),
+                [SEARCH_CONFIG] * 3 + params,
+            )
+        elif using.vendor == 'sqlite':
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE}' + (ids and ' WHERE rowid' + ids),
+                params,
+            )
+            cursor.execute(
+                SQLITE_INSERT_SQL + (ids and ' WHERE id' + ids), params
+            )
+
+
+def delete_from_search_index(recipe_id):
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [recipe_id]
+            )
+
+
+def fts5_query(value):
+    """Каждое слово запроса ищется как префикс, синтаксис FTS5 экранируется."""
+    return ' '.join(
+        '"{}"*'.format(word.replace('"', '""')) for word in value.split()
+    )
+
+
+def search_recipes(queryset, value):
+    """Фильтрует рецепты по поисковому запросу и сортирует по релевантности."""
+    if not value.strip():
+        return queryset
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(
+            value, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-pub_date')
+    if connection.vendor == 'sqlite':
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[
+                f'{FTS_TABLE}.rowid = recipes_recipe.id',
+                f'{FTS_TABLE} MATCH %s',
+            ],
+            params=[fts5_query(value)],
+            select={'rank': f'{FTS_TABLE}.rank'},
+        ).order_by('rank', '-pub_date')
+    return queryset.filter(name__icontains=value)
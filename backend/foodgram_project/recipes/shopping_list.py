@@ -0,0 +1,83 @@
+from django.db import connection, transaction
+
+from .models import ShoppingCart, ShoppingListItem
+
+UPSERT_SQL = '''
+    INSERT INTO recipes_shoppinglistitem (user_id, ingredient_id, total_amount)
+    SELECT cart.user_id, recipe_ingredient.ingredient_id,
+        %s * SUM(recipe_ingredient.amount)
+    FROM recipes_shoppingcart AS cart
+    JOIN recipes_recipeingredient AS recipe_ingredient
+        ON recipe_ingredient.recipe_id = cart.recipe_id
+    WHERE {where}
+    GROUP BY cart.user_id, recipe_ingredient.ingredient_id
+    ON CONFLICT (user_id, ingredient_id) DO UPDATE SET total_amount =
+        recipes_shoppinglistitem.total_amount + excluded.total_amount
+'''
+
+RECIPES_UPSERT_SQL = '''
+    INSERT INTO recipes_shoppinglistitem (user_id, ingredient_id, total_amount)
+    SELECT %s, ingredient_id, %s * SUM(amount)
+    FROM recipes_recipeingredient
+    WHERE recipe_id IN ({ids})
+    GROUP BY ingredient_id
+    ON CONFLICT (user_id, ingredient_id) DO UPDATE SET total_amount =
+        recipes_shoppinglistitem.total_amount + excluded.total_amount
+'''
+
+
+def update_shopping_lists(recipe_id, sign, user_id=None):
+    """
+    Прибавляет (sign=1) или вычитает (sign=-1) продукты рецепта в
+    списках покупок всех, у кого рецепт в корзине, или только user_id.
+    Вызывается после добавления рецепта в корзину и до удаления из неё.
+    """
+    where, params = 'cart.recipe_id = %s', [sign, recipe_id]
+    carts = ShoppingCart.objects.filter(recipe_id=recipe_id)
+    if user_id is not None:
+        where += ' AND cart.user_id = %s'
+        params.append(user_id)
+        carts = carts.filter(user_id=user_id)
+    with connection.cursor() as cursor:
+        cursor.execute(UPSERT_SQL.format(where=where), params)
+    if sign < 0:
+        ShoppingListItem.objects.filter(
+            user__in=carts.values('user'), total_amount__lte=0
+        ).delete()
+
+
+def change_shopping_list(user_id, recipe_ids, sign):
+    """
+    Прибавляет или вычитает продукты рецептов recipe_ids в списке покупок
+    user_id. В отличие от update_shopping_lists не читает корзину, поэтому
+    вызывается с id, которые вернули вставка или удаление строк корзины.
+    """
+    if not recipe_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            RECIPES_UPSERT_SQL.format(
+                ids=', '.join(['%s'] * len(recipe_ids))
+            ),
+            [user_id, sign, *recipe_ids],
+        )
+    if sign < 0:
+        ShoppingListItem.objects.filter(
+            user_id=user_id, total_amount__lte=0
+        ).delete()
+
+
+def rebuild_shopping_lists(user_ids):
+    """Пересчитывает списки покупок пользователей по их корзинам."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    with transaction.atomic():
+        ShoppingListItem.objects.filter(user__in=user_ids).delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                UPSERT_SQL.format(where='cart.user_id IN ({})'.format(
+                    ', '.join(['%s'] * len(user_ids))
+                )),
+                [1, *user_ids],
+            )
@@ -0,0 +1,39 @@
+import hashlib
+import posixpath
+
+from django.core.files.storage import FileSystemStorage, storages
+
+RECIPE_IMAGES_STORAGE = 'recipe_images'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Имя файла — SHA-256 его содержимого в каталоге загрузки, поэтому
+    одинаковые файлы хранятся один раз, а содержимое по адресу никогда не
+    меняется и его можно кэшировать навсегда. Файлы не удаляются вместе с
+    рецептами: общий файл может принадлежать нескольким, неиспользуемые
+    убирает команда collect_media_garbage.
+    """
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = posixpath.split(name)
+        _, extension = posixpath.splitext(filename)
+        digest = digest.hexdigest()
+        return posixpath.join(
+            directory, digest[:2], digest + extension.lower()
+        )
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
+
+
+def recipe_image_storage():
+    return storages[RECIPE_IMAGES_STORAGE]